@@ -1,16 +1,39 @@
-from flask import Flask, render_template_string, request
-import pandas as pd
-import requests
+import cProfile
+import csv
+import gzip
+import hashlib
+import json
+import os
+import pstats
+import time
+from functools import lru_cache, partial
 from io import StringIO
-from itertools import combinations
+
+from flask import Flask, Response, g, render_template, request, stream_template, stream_with_context
+import metrics
+from contest import add_contest, gpp_contest
+from metrics import span
+from optimizer import DK_SHOWDOWN, ROSTER_FORMATS, STACK_RULES, generate_all_lineups, iter_lineups, optimize
+from precompute import LineupCache
+from simulation import add_simulation
+from slate import GOOGLE_SHEET_CSV_URLS, SlateStore, matchup_players
+from snapshot import SNAPSHOT_PATH, SnapshotStore
+from solver import Overloaded, SolverPool
 
 app = Flask(__name__)
 
-GOOGLE_SHEET_CSV_URLS = [
-    "https://docs.google.com/spreadsheets/d/e/2PACX-1vSwiZjQ1dK9Wxe_GYcoeELm3-nXy-xGEG4WSbCXuk-JClxcF9kEseWhAovCsWwx_8NkgoSryDNKZATO/pub?output=csv",
-    "https://docs.google.com/spreadsheets/d/e/2PACX-1vSwiZjQ1dK9Wxe_GYcoeELm3-nXy-xGEG4WSbCXuk-JClxcF9kEseWhAovCsWwx_8NkgoSryDNKZATO/pub?gid=1631685663&single=true&output=csv"
-]
-SALARY_CAP = 50000
+MAX_LINEUPS = 150
+MAX_FIELD = 20000    # opponent lineups a contest simulation may draw
+PAGE_CACHE_SIZE = 128    # rendered pages / API bodies kept per process
+# ?profile=1 / X-Profile swap the response for a cProfile dump; off unless set
+ENABLE_PROFILING = os.environ.get("ENABLE_PROFILING", "").lower() in ("1", "true", "yes")
+snapshots = SnapshotStore(SNAPSHOT_PATH) if SNAPSHOT_PATH else None
+slate_store = SlateStore(GOOGLE_SHEET_CSV_URLS, snapshots=snapshots)
+solver_pool = SolverPool()
+lineup_cache = LineupCache(MAX_LINEUPS, solve=partial(solver_pool.run, generate_all_lineups),
+                           search=partial(solver_pool.queue, optimize), snapshots=snapshots)
+warm_search = partial(solver_pool.run, optimize)
+slate_store.subscribe(lineup_cache.on_slate_change)
 
 PLAYER_HTML_TEMPLATE = """
 <!DOCTYPE html>
@@ -51,8 +74,30 @@ select { font-size: 14px; padding: 4px 8px; margin-left: 10px; }
 
 <form method="get" action="/lineups">
 <input type="hidden" name="matchup" value="{{ matchup }}">
+<label>Contest:</label>
+<select name="format" onchange="this.form.max_team.max = this.selectedOptions[0].dataset.size - 1">
+  {% for key, roster in formats.items() %}
+    <option value="{{ key }}" data-size="{{ roster.size }}">{{ roster.name }}</option>
+  {% endfor %}
+</select>
+
 <label>Number of Lineups:</label>
-<input type="number" name="count" value="1" min="1" max="10">
+<input type="number" name="count" value="1" min="1" max="{{ max_lineups }}">
+
+<label>Min Unique Players:</label>
+<input type="number" name="min_unique" value="0" min="0" max="5">
+
+<label>Max Exposure %:</label>
+<input type="number" name="max_exposure" value="100" min="1" max="100">
+
+<label><input type="checkbox" name="simulate" value="1"> Simulate</label>
+
+<label>Contest Entries:</label>
+<input type="number" name="field" value="0" min="0" max="{{ max_field }}">
+
+<label>Entry Fee $:</label>
+<input type="number" name="entry_fee" value="1" min="0.25" step="0.25">
+<label><input type="checkbox" name="stream" value="1"> Stream Results</label>
 
 <label>Game Script:</label>
 <select name="script">
@@ -61,6 +106,19 @@ select { font-size: 14px; padding: 4px 8px; margin-left: 10px; }
   <option value="pass">Pass Heavy (QB/WR/TE Captain)</option>
 </select>
 
+<br><br>
+<label>Stacking:</label>
+<label><input type="checkbox" name="rule" value="qb_stack"> QB Captain + 2 Pass Catchers</label>
+<label><input type="checkbox" name="rule" value="no_opposing_dst"> No DST vs. Captain</label>
+<label>Max Per Team:</label>
+<input type="number" name="max_team" value="" min="1" max="{{ (formats.values()|first).size - 1 }}" placeholder="No limit">
+
+<br><br>
+<label>Ownership Leverage (pts per 1%):</label>
+<input type="number" name="leverage" value="0" min="0" step="0.05">
+<label>Max Total Ownership %:</label>
+<input type="number" name="max_ownership" value="" min="0" step="1">
+
 <br><br>
 <table>
 <thead>
@@ -70,6 +128,7 @@ select { font-size: 14px; padding: 4px 8px; margin-left: 10px; }
 <th>POS</th>
 <th>Salary</th>
 <th>Projected Points</th>
+<th>Own %</th>
 <th>CPT Lock</th>
 <th>FLEX Lock</th>
 <th>Exclude</th>
@@ -83,6 +142,7 @@ select { font-size: 14px; padding: 4px 8px; margin-left: 10px; }
 <td>{{ p.POS }}</td>
 <td>${{ "{:,.0f}".format(p.Salary) }}</td>
 <td>{{ "%.2f"|format(p.Proj) }}</td>
+<td>{{ "%.1f"|format(p.Own) }}</td>
 <td><input type="radio" name="lock_cpt" value="{{ p.Name }}"></td>
 <td><input type="checkbox" name="lock_flex" value="{{ p.Name }}"></td>
 <td><input type="checkbox" name="exclude" value="{{ p.Name }}"></td>
@@ -112,7 +172,7 @@ h1 { color: #2c3e50; margin-bottom: 20px; }
 table { border-collapse: collapse; width: 100%; margin-top: 10px; }
 th, td { border: 1px solid #ddd; padding: 8px; text-align: center; }
 th { background-color: #34495e; color: white; }
-.role-CPT { color: #e74c3c; font-weight: bold; }
+.role-CPT, .role-MVP { color: #e74c3c; font-weight: bold; }
 .role-FLEX { color: #2980b9; }
 button { padding: 10px 16px; background-color: #3498db; color: white; border: none; border-radius: 5px; cursor: pointer; font-size: 14px; }
 button:hover { background-color: #2980b9; }
@@ -129,9 +189,22 @@ button:hover { background-color: #2980b9; }
 <div class="card">
 <h2>Lineup {{ loop.index }}</h2>
 <p><strong>Salary:</strong> ${{ "{:,.0f}".format(lu.Salary) }} | 
-<strong>Projected:</strong> {{ "%.2f"|format(lu.Projected) }}</p>
+<strong>Projected:</strong> {{ "%.2f"|format(lu.Projected) }} |
+<strong>Ownership:</strong> {{ "%.1f"|format(lu.Ownership) }}%</p>
+{% if lu.Sim %}
+<p><strong>Sim Mean:</strong> {{ "%.2f"|format(lu.Sim.mean) }} |
+<strong>10th–90th:</strong> {{ "%.1f"|format(lu.Sim.p10) }}–{{ "%.1f"|format(lu.Sim.p90) }} |
+<strong>Win:</strong> {{ "%.1f"|format(lu.Sim.win * 100) }}% |
+<strong>Cash:</strong> {{ "%.1f"|format(lu.Sim.cash * 100) }}%</p>
+{% endif %}
+{% if lu.Contest %}
+<p><strong>Avg Finish:</strong> {{ "{:,.0f}".format(lu.Contest.place) }} (top {{ "%.1f"|format(lu.Contest.top * 100) }}%) |
+<strong>ROI:</strong> {{ "%+.1f"|format(lu.Contest.roi * 100) }}% |
+<strong>Contest Win:</strong> {{ "%.2f"|format(lu.Contest.win * 100) }}% |
+<strong>Contest Cash:</strong> {{ "%.1f"|format(lu.Contest.cash * 100) }}%</p>
+{% endif %}
 <table>
-<tr><th>Role</th><th>Name</th><th>Team</th><th>Salary</th><th>Proj</th></tr>
+<tr><th>Role</th><th>Name</th><th>Team</th><th>Salary</th><th>Proj</th><th>Own %</th></tr>
 {% for p in lu.players %}
 <tr>
 <td class="role-{{ p.Role }}">{{ p.Role }}</td>
@@ -139,12 +212,21 @@ button:hover { background-color: #2980b9; }
 <td>{{ p.Team }}</td>
 <td>${{ "{:,.0f}".format(p.Salary) }}</td>
 <td>{{ "%.2f"|format(p.Proj) }}</td>
+<td>{{ "%.1f"|format(p.Own) }}</td>
 </tr>
 {% endfor %}
 </table>
 </div>
+{% else %}
+{% if not error %}
+<p style="color:red;">Could not generate lineups with these selections.</p>
+{% endif %}
 {% endfor %}
 
+{% if query %}
+<p><a href="/lineups.csv?{{ query }}">⬇ Download DraftKings CSV</a></p>
+{% endif %}
+
 <form action="/" method="get">
     <button type="submit">⬅ Back to Player Pool</button>
 </form>
@@ -153,129 +235,249 @@ button:hover { background-color: #2980b9; }
 </html>
 """
 
-def clean_data(df):
-    df = df.dropna(how='all')
-    df.columns = df.columns.str.strip().str.upper()
-    name_col = next((c for c in df.columns if "PLAYER" in c), None)
-    salary_col = next((c for c in df.columns if "SALARY" in c), None)
-    # Use the first "FINAL POINTS" column, not "FINAL POINTS1"
-    proj_col = next((c for c in df.columns if c.strip() == "FINAL POINTS"), None)
-    team_col = next((c for c in df.columns if "TEAM" in c.upper()), None)
-    pos_col = next((c for c in df.columns if c == "POS"), None)
-    matchup_col = next((c for c in df.columns if c.replace(' ', '').upper() == "MATCHUP"), None)
-
-    df = df.rename(columns={name_col: "Name", salary_col: "Salary", proj_col: "Proj", team_col: "Team", pos_col: "POS", matchup_col: "Matchup"})
-    df["Salary"] = df["Salary"].astype(str).str.replace(r'[\$,]', '', regex=True)
-    df = df[df["Salary"].str.replace('.', '', 1).str.isnumeric()]
-    df["Salary"] = df["Salary"].astype(float)
-    df["Proj"] = pd.to_numeric(df["Proj"], errors="coerce")
-    df = df.dropna(subset=["Name", "Salary", "Proj", "POS", "Matchup"]).drop_duplicates(subset=["Name", "Matchup"])
-    return df[["Name", "Team", "POS", "Salary", "Proj", "Matchup"]]
+# compiled once; render() and stream_template() reuse the parsed templates
+PLAYER_PAGE = app.jinja_env.from_string(PLAYER_HTML_TEMPLATE)
+LINEUP_PAGE = app.jinja_env.from_string(LINEUP_HTML_TEMPLATE)
 
 def get_all_matchups():
-    matchups = set()
-    for url in GOOGLE_SHEET_CSV_URLS:
-        try:
-            df = pd.read_csv(StringIO(requests.get(url, timeout=10).text))
-            df = clean_data(df)
-            matchups |= set(df["Matchup"].unique())
-        except Exception:
-            continue
-    matchups = [m for m in matchups if pd.notnull(m) and str(m).strip() != ""]
-    return sorted(matchups)
+    return slate_store.matchups()
+
+def slate_digest():
+    # keys caches and ETags by what the sheets hold rather than by the
+    # process-local version, so every worker agrees and none repeats a key
+    slate_store.get()
+    return slate_store.digest
 
 def get_players_for_matchup(matchup):
-    all_players = []
-    for url in GOOGLE_SHEET_CSV_URLS:
-        try:
-            df = pd.read_csv(StringIO(requests.get(url, timeout=10).text))
-            df = clean_data(df)
-            all_players.append(df[df["Matchup"] == matchup])
-        except Exception:
-            continue
-    if not all_players:
-        return pd.DataFrame([], columns=["Name", "Team", "POS", "Salary", "Proj"])
-    df_out = pd.concat(all_players)
-    if df_out.empty:
-        return pd.DataFrame([], columns=["Name", "Team", "POS", "Salary", "Proj"])
-    return df_out
-
-def generate_all_lineups(df, lock_cpt=None, lock_flex=[], exclude=[], max_lineups=5, script=None):
-    players = df.copy()
-    if exclude:
-        players = players[~players["Name"].isin(exclude)]
-    if len(players) < 6:
-        return []
-    if lock_cpt:
-        cpt_pool = players[players["Name"] == lock_cpt]
-    else:
-        if script == "run":
-            cpt_pool = players[players["POS"] == "RB"]
-        elif script == "pass":
-            cpt_pool = players[players["POS"].isin(["QB", "WR", "TE"])]
-        else:
-            cpt_pool = players
-    cpt_pool = cpt_pool.sort_values(by="Salary", ascending=False)
-    flex_pool = players
-    all_lineups = []
-    flex_combos = combinations(flex_pool["Name"], 5)
-    for flex_names in flex_combos:
-        if not all(f in flex_names for f in lock_flex):
-            continue
-        for cpt_row in cpt_pool.itertuples():
-            if cpt_row.Name in flex_names:
-                continue
-            if cpt_row.Salary <= 5000:    # Captain must be more than $5,000
-                continue
-            lineup = [{"Name": cpt_row.Name, "Role": "CPT", "Salary": round(cpt_row.Salary * 1.5, -2),
-                       "Proj": cpt_row.Proj * 1.5, "Team": cpt_row.Team}]
-            for name in flex_names:
-                row = players[players["Name"] == name].iloc[0]
-                lineup.append({"Name": row.Name, "Role": "FLEX", "Salary": row.Salary, "Proj": row.Proj, "Team": row.Team})
-            total_salary = sum(p["Salary"] for p in lineup)
-            if total_salary <= SALARY_CAP:
-                total_proj = sum(p["Proj"] for p in lineup)
-                all_lineups.append({"players": lineup, "Salary": total_salary, "Projected": total_proj})
-            if len(all_lineups) >= max_lineups:
-                break
-        if len(all_lineups) >= max_lineups:
-            break
-    return sorted(all_lineups, key=lambda x: x["Projected"], reverse=True)[:max_lineups]
+    with span("load_players"):
+        return slate_store.players_for(matchup)
 
-@app.route('/')
-def player_pool():
-    matchup = request.args.get("matchup")
+def render(template, **context):
+    with span("render"):
+        return render_template(template, **context)
+
+@app.before_request
+def start_request():
+    g.started = time.perf_counter()
+    if ENABLE_PROFILING and (request.args.get("profile") or request.headers.get("X-Profile")):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def finish_request(response):
+    route = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - g.started, route=route)
+    profiler = g.pop("profiler", None)
+    if profiler is None:
+        return response
+    profiler.disable()
+    out = StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(40)
+    return Response(out.getvalue(), mimetype="text/plain")
+
+# Rendered pages are cached per slate digest: a new slate changes the key, so
+# stale pages are never served and simply age out of the LRU.
+@lru_cache(maxsize=PAGE_CACHE_SIZE)
+def player_page(slate, matchup):
     matchups = get_all_matchups()
     if not matchup and matchups:
         matchup = matchups[0]
+    df = get_players_for_matchup(matchup)
+    players = df.to_dict(orient="records")
+    if not players:
+        return render(PLAYER_PAGE, players=[], matchups=matchups, matchup=matchup, max_lineups=MAX_LINEUPS,
+                      formats=ROSTER_FORMATS, max_field=MAX_FIELD) + "<h3>No players available for this matchup.</h3>"
+    return render(PLAYER_PAGE, players=players, matchups=matchups, matchup=matchup, max_lineups=MAX_LINEUPS,
+                  formats=ROSTER_FORMATS, max_field=MAX_FIELD)
+
+@app.route('/')
+def player_pool():
     try:
-        df = get_players_for_matchup(matchup)
-        players = df.to_dict(orient="records")
-        if not players:
-            return render_template_string(PLAYER_HTML_TEMPLATE, players=[], matchups=matchups, matchup=matchup) + "<h3>No players available for this matchup.</h3>"
-        return render_template_string(PLAYER_HTML_TEMPLATE, players=players, matchups=matchups, matchup=matchup)
+        return player_page(slate_digest(), request.args.get("matchup"))
     except Exception as e:
         return f"<p>Error loading player pool: {e}</p>"
 
+def lineup_args():
+    roster = ROSTER_FORMATS.get(request.args.get("format"), DK_SHOWDOWN)
+    count = int(request.args.get("count", 1))
+    script = request.args.get("script", "").lower()
+    count = max(1, min(count, MAX_LINEUPS))
+    min_unique = max(0, min(int(request.args.get("min_unique", 0)), roster.size - 1))
+    max_exposure = max(1.0, min(float(request.args.get("max_exposure", 100)), 100.0)) / 100
+    rules = [STACK_RULES[name] for name in request.args.getlist("rule") if name in STACK_RULES]
+    max_team = int(request.args.get("max_team") or 0)
+    if 0 < max_team < roster.size:
+        rules.append({"rule": "max_per_team", "max": max_team})
+    leverage = max(0.0, float(request.args.get("leverage") or 0))
+    max_ownership = float(request.args.get("max_ownership") or 0) or None
+    return {"max_lineups": count, "script": script, "min_unique": min_unique, "max_exposure": max_exposure,
+            "rules": rules, "leverage": leverage, "max_ownership": max_ownership, "roster": roster}
+
+def contest_args():
+    # the contest the simulated lineups are played against, or None for no field
+    entries = max(0, min(int(request.args.get("field") or 0), MAX_FIELD))
+    if entries < 2:
+        return None
+    return gpp_contest(entries, max(0.25, float(request.args.get("entry_fee") or 1)))
+
+def find_lineups(df, stream=False):
+    lock_cpt = request.args.get("lock_cpt")
+    lock_flex = request.args.getlist("lock_flex")
+    exclude = request.args.getlist("exclude")
+    options = lineup_args()
+    roster = options["roster"]
+    args = (df, lock_cpt, lock_flex, exclude, options["max_lineups"], options["script"], options["min_unique"],
+            options["max_exposure"], options["rules"], options["leverage"], options["max_ownership"])
+    if options["min_unique"] or options["max_exposure"] < 1:
+        if stream:
+            # each diverse round searches on the pool; its lineups stream back as accepted
+            return solver_pool.stream(lambda call: iter_lineups(*args, roster=roster, search=partial(call, optimize)))
+        return solver_pool.run(generate_all_lineups, *args, roster=roster)
+    if (lock_cpt or lock_flex or exclude or options["rules"] or options["leverage"] or options["max_ownership"]
+            or roster is not DK_SHOWDOWN):
+        # locks, scratches and rules narrow an earlier solve on this slate, so
+        # they are re-solved incrementally from its warm-start state; only the
+        # showdown roster is precomputed, other formats warm up as they are used.
+        # Only the warm-start lookup runs here; a miss is searched on the solver
+        # pool. The lineups arrive together either way, so there is nothing to stream.
+        warm = lineup_cache.warm_start(df, roster)
+        return generate_all_lineups(*args, warm=warm, search=warm_search)
+    return lineup_cache.get(df, options["script"], options["max_lineups"])
+
+def closing(response, lineups):
+    # streamed lineups hold a solver slot until they are closed; the server closes
+    # a response even when it never reads the body (HEAD, a client gone early)
+    if hasattr(lineups, "close"):
+        response.call_on_close(lineups.close)
+    return response
+
+def lineup_page(matchup, query, simulate=False):
+    df = get_players_for_matchup(matchup)
+    if df.empty:
+        return "<h2>No players available for selected matchup.</h2><a href='/'>Back</a>"
+    with span("optimize"):
+        lineups = find_lineups(df)
+    if simulate:
+        roster = lineup_args()["roster"]
+        with span("simulate"):
+            lineups = solver_pool.run(add_simulation, df, lineups, roster=roster)
+        contest = contest_args()
+        if contest:
+            with span("contest"):
+                lineups = solver_pool.run(add_contest, df, lineups, contest, roster=roster)
+    if not lineups:
+        return render(LINEUP_PAGE, lineups=[], error="Could not generate lineups with these selections.")
+    return render(LINEUP_PAGE, lineups=lineups, error=None, query=query)
+
+@lru_cache(maxsize=PAGE_CACHE_SIZE)
+def cached_lineup_page(slate, matchup, query):
+    # the query string holds every option find_lineups reads, and the search is
+    # deterministic, so (slate digest, query) identifies the page
+    return lineup_page(matchup, query)
+
 @app.route('/lineups')
 def generate_lineups():
     matchup = request.args.get("matchup")
+    query = request.query_string.decode()
     try:
-        df = get_players_for_matchup(matchup)
-        if df.empty:
-            return "<h2>No players available for selected matchup.</h2><a href='/'>Back</a>"
-        lock_cpt = request.args.get("lock_cpt")
-        lock_flex = request.args.getlist("lock_flex")
-        exclude = request.args.getlist("exclude")
-        count = int(request.args.get("count", 1))
-        script = request.args.get("script", "").lower()
-        count = max(1, min(count, 10))
-        lineups = generate_all_lineups(df, lock_cpt, lock_flex, exclude, count, script)
-        if not lineups:
-            return render_template_string(LINEUP_HTML_TEMPLATE, lineups=[], error="Could not generate lineups with these selections.")
-        return render_template_string(LINEUP_HTML_TEMPLATE, lineups=lineups, error=None)
+        simulate = request.args.get("simulate")
+        if request.args.get("stream") and not simulate:
+            df = get_players_for_matchup(matchup)
+            if df.empty:
+                return "<h2>No players available for selected matchup.</h2><a href='/'>Back</a>"
+            lineups = find_lineups(df, stream=True)
+            return closing(Response(stream_template(LINEUP_PAGE, lineups=lineups, error=None, query=query)), lineups)
+        if simulate:
+            # simulated pages are fresh random draws, so they are not cached
+            return lineup_page(matchup, query, simulate=True)
+        return cached_lineup_page(slate_digest(), matchup, query)
+    except Overloaded:
+        raise
     except Exception as e:
         return f"<p>Error generating lineups: {e}</p>"
 
+@app.route('/lineups.csv')
+def export_lineups():
+    df = get_players_for_matchup(request.args.get("matchup"))
+    roster = lineup_args()["roster"]
+    lineups = find_lineups(df, stream=True) if not df.empty else []
+
+    def rows():
+        buffer = StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(roster.header)
+        for lu in lineups:
+            writer.writerow([p["Name"] for p in lu["players"]])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    return closing(Response(stream_with_context(rows()), mimetype="text/csv",
+                            headers={"Content-Disposition": "attachment; filename=lineups.csv"}), lineups)
+
+@app.route('/lineups/all')
+def generate_slate_lineups():
+    options = lineup_args()
+    players = slate_store.get()
+
+    # one solve per matchup on the shared solver processes, under one solver slot
+    results = solver_pool.run_all(generate_all_lineups, [(matchup, (matchup_players(players, matchup),), options)
+                                                         for matchup in players.index.unique()])
+
+    def stream():
+        for matchup, lineups in results:
+            yield json.dumps({"matchup": matchup, "lineups": lineups}) + "\n"
+
+    return closing(Response(stream_with_context(stream()), mimetype="application/x-ndjson"), results)
+
+def api_players():
+    return {"matchup": request.args.get("matchup"),
+            "players": get_players_for_matchup(request.args.get("matchup")).to_dict(orient="records")}
+
+def api_lineups():
+    df = get_players_for_matchup(request.args.get("matchup"))
+    return {"matchup": request.args.get("matchup"), "lineups": find_lineups(df) if not df.empty else []}
+
+API_ROUTES = {
+    "/api/matchups": lambda: {"matchups": get_all_matchups()},
+    "/api/players": api_players,
+    "/api/lineups": api_lineups,
+}
+
+@lru_cache(maxsize=PAGE_CACHE_SIZE)
+def api_body(slate, path, query, gzipped):
+    body = json.dumps({"version": slate, **API_ROUTES[path]()}, separators=(",", ":")).encode()
+    return gzip.compress(body, compresslevel=6) if gzipped else body
+
+@app.route('/api/matchups')
+@app.route('/api/players')
+@app.route('/api/lineups')
+def api():
+    # Compact JSON, gzipped when the client accepts it. The ETag is derived from
+    # the slate digest, the query and the content coding (a strong ETag differs
+    # per coding), so clients revalidate for free until the slate changes, and
+    # identical requests reuse the encoded body.
+    slate = slate_digest()
+    query = request.query_string.decode()
+    gzipped = "gzip" in request.accept_encodings
+    coding = "gzip" if gzipped else "identity"
+    etag = hashlib.sha1(f"{slate}:{request.path}?{query}:{coding}".encode()).hexdigest()[:20]
+    headers = {"ETag": f'"{etag}"', "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+    body = api_body(slate, request.path, query, gzipped)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, mimetype="application/json", headers=headers)
+
+@app.errorhandler(Overloaded)
+def solver_overloaded(e):
+    return Response(f"<p>{e}</p>", status=503, headers={"Retry-After": str(e.retry_after)})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
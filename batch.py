@@ -0,0 +1,67 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from optimizer import ROSTER_FORMATS, STACK_RULES, generate_all_lineups
+from slate import GOOGLE_SHEET_CSV_URLS, SlateStore, matchup_players
+
+_slate = None
+
+
+def _init_worker(players):
+    # each worker receives the cleaned slate once and only reads from it
+    global _slate
+    _slate = players
+
+
+def _solve(matchup, options):
+    return generate_all_lineups(matchup_players(_slate, matchup), **options)
+
+
+def generate_slate(players, processes=None, **options):
+    # yields (matchup, lineups) for every matchup on the slate as soon as its
+    # worker finishes; options are passed through to generate_all_lineups
+    matchups = list(players.index.unique())
+    if not matchups:
+        return
+    processes = min(processes or os.cpu_count() or 1, len(matchups))
+    # forkserver, as in solver.py: forking a web worker would copy its threads' locks
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(players,),
+                             mp_context=multiprocessing.get_context("forkserver")) as pool:
+        futures = {pool.submit(_solve, matchup, options): matchup for matchup in matchups}
+        for future in as_completed(futures):
+            yield futures[future], future.result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate lineups for every matchup on the slate.")
+    parser.add_argument("--count", type=int, default=1)
+    parser.add_argument("--format", default="dk_showdown", choices=sorted(ROSTER_FORMATS))
+    parser.add_argument("--script", default="", choices=["", "run", "pass"])
+    parser.add_argument("--min-unique", type=int, default=0)
+    parser.add_argument("--max-exposure", type=float, default=100.0, help="percent")
+    parser.add_argument("--rule", action="append", default=[], choices=sorted(STACK_RULES))
+    parser.add_argument("--max-per-team", type=int, default=None)
+    parser.add_argument("--leverage", type=float, default=0.0, help="points per percent of ownership")
+    parser.add_argument("--max-ownership", type=float, default=None, help="percent, summed over the lineup")
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    rules = [STACK_RULES[name] for name in args.rule]
+    if args.max_per_team:
+        rules.append({"rule": "max_per_team", "max": args.max_per_team})
+    players = SlateStore(GOOGLE_SHEET_CSV_URLS).get()
+    options = {"max_lineups": args.count, "script": args.script, "min_unique": args.min_unique,
+               "max_exposure": args.max_exposure / 100, "rules": rules, "leverage": args.leverage,
+               "max_ownership": args.max_ownership, "roster": ROSTER_FORMATS[args.format]}
+    for matchup, lineups in generate_slate(players, args.processes, **options):
+        json.dump({"matchup": matchup, "lineups": lineups}, sys.stdout)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from io import StringIO
+from itertools import combinations, permutations
+
+import numpy as np
+import pandas as pd
+
+import app
+from contest import add_contest, gpp_contest
+from optimizer import (DK_SHOWDOWN, DST_POSITIONS, MIN_CPT_SALARY, OFFENSE_POSITIONS, OWN_TOLERANCE,
+                       ROSTER_FORMATS, SCRIPT_CPT_POSITIONS, STACK_RULES, cpt_salary, generate_all_lineups)
+from slate import FetchResult, SlateStore, clean_data, parse_sheet
+from snapshot import SnapshotStore
+
+SLATE_SIZES = (20, 40, 80)
+LINEUP_COUNTS = (1, 20, 150)
+REFERENCE_SIZES = (14, 20)    # slates small enough to check against brute force
+CONTEST_FIELDS = (1000, 10000)
+CONTEST_SIMS = 2000
+DIVERSE_MAX_RATIO = 40    # most 150 diverse lineups may cost, in single-lineup solves
+POSITION_WEIGHTS = {"QB": 0.08, "RB": 0.18, "WR": 0.38, "TE": 0.14, "K": 0.1, "DST": 0.12}
+
+
+def synthetic_sheet(n_players, matchups=1, seed=0):
+    # CSV text shaped like the published sheets: PLAYER, SALARY ("$9,500"),
+    # FINAL POINTS, TEAM, POS, MATCHUP and OWN% ("12.5%"), plus a column the app ignores
+    rng = np.random.default_rng(seed)
+    rows = []
+    for m in range(matchups):
+        home, away = f"H{m:02d}", f"A{m:02d}"
+        positions = rng.choice(list(POSITION_WEIGHTS), n_players, p=list(POSITION_WEIGHTS.values()))
+        salaries = rng.integers(2, 61, n_players) * 200
+        projections = np.round(salaries / 1000 * rng.uniform(1.2, 3.2, n_players), 2)
+        ownership = np.round(np.clip(projections * rng.uniform(0.5, 2.5, n_players), 0.5, 80), 1)
+        for i in range(n_players):
+            rows.append({"PLAYER": f"{home}{away} Player {i}", "SALARY": f"${salaries[i]:,}",
+                         "FINAL POINTS": projections[i], "TEAM": home if i % 2 else away,
+                         "POS": positions[i], "MATCHUP": f"{away}@{home}", "OWN%": f"{ownership[i]}%", "NOTES": ""})
+    return pd.DataFrame(rows).to_csv(index=False)
+
+
+class LocalSheets:
+    # stands in for slate.fetch_sheets so the whole run is offline
+    def __init__(self, sheets):
+        self.sheets = sheets
+
+    def __call__(self, sheet_requests):
+        return [FetchResult(url, 200, self.sheets[url], None, None, None, 0.0) for url, _ in sheet_requests]
+
+
+def reference_rules(rules, c, flex, teams, positions):
+    # rows of flex (player ids) that satisfy every stacking rule with captain c
+    keep = np.ones(len(flex), dtype=bool)
+    same_team = teams[flex] == teams[c]
+    for rule in rules:
+        if rule["rule"] == "max_per_team":
+            on_team = same_team.sum(axis=1) + 1
+            keep &= (on_team <= rule["max"]) & (flex.shape[1] + 1 - on_team <= rule["max"])
+        elif rule["rule"] == "no_opposing_dst" and positions[c] in OFFENSE_POSITIONS:
+            keep &= ~(np.isin(positions[flex], DST_POSITIONS) & ~same_team).any(axis=1)
+        elif rule["rule"] == "cpt_stack" and positions[c] in rule["cpt"]:
+            keep &= (np.isin(positions[flex], rule["with"]) & same_team).sum(axis=1) >= rule["min"]
+    return keep
+
+
+def reference_scores(df, n, lock_cpt=None, lock_flex=(), exclude=(), script=None, rules=None, leverage=0.0,
+                     max_ownership=None, roster=DK_SHOWDOWN):
+    # exhaustive search over every filling of the lead slots and every flex set
+    players = df.drop_duplicates(subset=["Name"])
+    players = players[~players["Name"].isin(exclude)].reset_index(drop=True)
+    salary = players["Salary"].to_numpy(float)
+    proj = players["Proj"].to_numpy(float)
+    own = players["Own"].to_numpy(float)
+    teams = players["Team"].to_numpy(str)
+    positions = players["POS"].to_numpy(str)
+    names = players["Name"].tolist()
+    locked = [names.index(name) for name in lock_flex]
+    k = roster.flex_slots - len(locked)
+    flex_open = [roster.flex_positions is None or p in roster.flex_positions for p in positions]
+    scores = []
+    for leads in permutations(range(len(players)), len(roster.slots)):
+        c = leads[0]
+        if lock_cpt and names[c] != lock_cpt:
+            continue
+        if not lock_cpt and script in SCRIPT_CPT_POSITIONS and positions[c] not in SCRIPT_CPT_POSITIONS[script]:
+            continue
+        if salary[c] <= roster.min_captain_salary or set(leads) & set(locked):
+            continue
+        if any(slot.positions is not None and positions[i] not in slot.positions
+               for slot, i in zip(roster.slots, leads)):
+            continue
+        others = [i for i in range(len(players)) if flex_open[i] and i not in leads and i not in locked]
+        combos = np.array(list(combinations(others, k)), dtype=np.intp).reshape(-1, k)
+        flex = np.concatenate([np.tile(locked, (len(combos), 1)).astype(np.intp), combos], axis=1)
+        total_salary = sum(float(cpt_salary(salary[i], slot.salary)) for slot, i in zip(roster.slots, leads))
+        total_salary = total_salary + salary[flex].sum(axis=1)
+        total_proj = sum(proj[i] * slot.points for slot, i in zip(roster.slots, leads)) + proj[flex].sum(axis=1)
+        total_own = own[list(leads)].sum() + own[flex].sum(axis=1)
+        total_proj = total_proj - leverage * total_own
+        keep = total_salary <= roster.salary_cap
+        if max_ownership is not None:
+            keep &= total_own <= max_ownership + OWN_TOLERANCE
+        for position, minimum in roster.flex_minimums.items():
+            keep &= (positions[flex] == position).sum(axis=1) >= minimum
+        if rules:
+            rest = np.concatenate([np.tile(leads[1:], (len(flex), 1)).astype(np.intp), flex], axis=1)
+            keep &= reference_rules(rules, c, rest, teams, positions)
+        scores.append(total_proj[keep])
+    if not scores:
+        return []
+    return sorted(np.concatenate(scores).tolist(), reverse=True)[:n]
+
+
+def variants(df):
+    by_proj = df.sort_values("Proj", ascending=False)
+    captain = by_proj[by_proj["Salary"] > MIN_CPT_SALARY]["Name"].iloc[0]
+    return {
+        "base": {},
+        "script_run": {"script": "run"},
+        "script_pass": {"script": "pass"},
+        "lock_cpt": {"lock_cpt": captain},
+        "lock_flex": {"lock_flex": by_proj["Name"].iloc[1:3].tolist()},
+        "exclude": {"exclude": by_proj["Name"].iloc[:3].tolist()},
+        "stacked": {"rules": [STACK_RULES["qb_stack"], STACK_RULES["no_opposing_dst"],
+                              {"rule": "max_per_team", "max": 4}]},
+        "leverage": {"leverage": 0.2, "max_ownership": 120},
+        "fd_mvp_star_pro": {"roster": ROSTER_FORMATS["fd_mvp_star_pro"]},
+        "dk_classic": {"roster": ROSTER_FORMATS["dk_classic"]},
+        "diverse": {"min_unique": 2, "max_exposure": 0.5},
+    }
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return result, {"min": min(times), "median": statistics.median(times), "runs": repeat}
+
+
+def bench_optimizer(results, repeat):
+    for size in SLATE_SIZES:
+        df = parse_sheet(synthetic_sheet(size, seed=size))
+        for variant, options in variants(df).items():
+            for count in LINEUP_COUNTS:
+                if variant == "diverse" and count == 1:
+                    continue
+                lineups, timing = timed(lambda: generate_all_lineups(df, max_lineups=count, **options), repeat)
+                results.append({"bench": "generate_all_lineups", "players": size, "variant": variant,
+                                "count": count, "lineups": len(lineups), **timing})
+
+
+def check_reference(checks):
+    for size in REFERENCE_SIZES:
+        df = parse_sheet(synthetic_sheet(size, seed=100 + size))
+        for variant, options in variants(df).items():
+            if variant == "diverse":
+                continue
+            leverage = options.get("leverage", 0.0)
+            got = [round(lu["Projected"] - leverage * lu["Ownership"], 6)
+                   for lu in generate_all_lineups(df, max_lineups=10, **options)]
+            expected = [round(s, 6) for s in reference_scores(df, 10, **options)]
+            checks.append({"check": "optimal_vs_brute_force", "players": size, "variant": variant,
+                           "passed": got == expected, "got": got, "expected": expected})
+
+
+def check_diverse_cost(checks, repeat):
+    # diverse rounds filter a plain top-K pool, so the whole set should cost a
+    # bounded number of single-lineup solves rather than one search per lineup
+    size = SLATE_SIZES[-1]
+    df = parse_sheet(synthetic_sheet(size, seed=size))
+    options = variants(df)["diverse"]
+    _, single = timed(lambda: generate_all_lineups(df, max_lineups=1), repeat)
+    _, diverse = timed(lambda: generate_all_lineups(df, max_lineups=150, **options), repeat)
+    ratio = diverse["median"] / single["median"]
+    checks.append({"check": "diverse_vs_single_time", "players": size, "variant": "diverse",
+                   "passed": ratio <= DIVERSE_MAX_RATIO, "ratio": ratio, "limit": DIVERSE_MAX_RATIO})
+
+
+def bench_pipeline(results, repeat):
+    for size in SLATE_SIZES:
+        text = synthetic_sheet(size, matchups=16, seed=size)
+        _, timing = timed(lambda: parse_sheet(text), repeat)
+        results.append({"bench": "parse_sheet", "players": size * 16, **timing})
+        _, timing = timed(lambda: clean_data(pd.read_csv(StringIO(text))), repeat)
+        results.append({"bench": "read_csv+clean_data", "players": size * 16, **timing})
+    with tempfile.TemporaryDirectory() as tmp:
+        urls = ["local://sheet-0"]
+        text = synthetic_sheet(SLATE_SIZES[-1], matchups=16)
+        snapshots = SnapshotStore(f"{tmp}/snapshots.sqlite3")
+        SlateStore(urls, fetch=LocalSheets({urls[0]: text}), snapshots=snapshots).get()
+        _, timing = timed(lambda: SlateStore(urls, fetch=LocalSheets({}), snapshots=snapshots)._restore(), repeat)
+        results.append({"bench": "snapshot_restore", "players": SLATE_SIZES[-1] * 16, **timing})
+    df = parse_sheet(synthetic_sheet(SLATE_SIZES[-1]))
+    lineups = generate_all_lineups(df, max_lineups=20)
+    for entries in CONTEST_FIELDS:
+        _, timing = timed(lambda: add_contest(df, lineups, gpp_contest(entries), CONTEST_SIMS, seed=0), repeat)
+        results.append({"bench": "add_contest", "players": SLATE_SIZES[-1], "entries": entries,
+                        "sims": CONTEST_SIMS, "lineups": len(lineups), **timing})
+
+
+def local_app(n_players=40, seed=0):
+    # points the app at synthetic sheets; returns the test client and a matchup
+    urls = ["local://sheet-0", "local://sheet-1"]
+    sheets = {url: synthetic_sheet(n_players, matchups=4, seed=seed + i) for i, url in enumerate(urls)}
+    store = SlateStore(urls, fetch=LocalSheets(sheets))
+    app.lineup_cache.snapshots = None
+    store.subscribe(app.lineup_cache.on_slate_change)
+    app.slate_store = store
+    matchup = store.matchups()[0]
+    # loading the slate queued its precompute; let it finish so it holds no
+    # solver slots and competes for no processes once measuring starts
+    app.lineup_cache._worker.submit(lambda: None).result()
+    return app.app.test_client(), matchup
+
+
+def check_solver_slots(checks):
+    # streamed routes hold a solver slot until their body is closed; HEAD
+    # requests and clients that leave before reading must still give it back
+    client, matchup = local_app(20)
+    slots = app.solver_pool._slots
+    free = slots._value
+    paths = {
+        "lineups_stream": f"/lineups?matchup={matchup}&count=20&min_unique=1&stream=1",
+        "lineups_csv": f"/lineups.csv?matchup={matchup}&count=20&min_unique=1",
+        "lineups_all": "/lineups/all?count=1",
+    }
+    for variant, path in paths.items():
+        for _ in range(free + 2):
+            client.head(path).close()
+        leaked_head = free - slots._value
+        for _ in range(free + 2):
+            response = client.get(path, buffered=False)
+            next(iter(response.response), None)
+            response.close()
+        leaked_close = free - slots._value
+        checks.append({"check": "solver_slots_released", "players": 20, "variant": variant,
+                       "passed": leaked_head == leaked_close == 0, "leaked_head": leaked_head,
+                       "leaked_early_close": leaked_close})
+
+
+def check_api_etag(checks):
+    # a fresh process numbers its first slate 1 whatever the sheets hold, so the
+    # ETag has to follow the sheets: new sheets must miss, the same ones must hit
+    client, matchup = local_app(20)
+    path = f"/api/players?matchup={matchup}"
+    etag = client.get(path).headers["ETag"].strip('"')
+    for variant, seed, status in (("changed_sheets", 10, 200), ("same_sheets", 0, 304)):
+        client, _ = local_app(20, seed=seed)
+        got = client.get(path, headers={"If-None-Match": f'"{etag}"'}).status_code
+        checks.append({"check": "api_etag_follows_content", "players": 20, "variant": variant,
+                       "passed": got == status, "status": got, "expected": status})
+
+
+def bench_routes(results, repeat):
+    client, matchup = local_app()
+    paths = {
+        "player_pool": f"/?matchup={matchup}",
+        "lineups_cached": f"/lineups?matchup={matchup}&count=20",
+        "lineups_uncached": f"/lineups?matchup={matchup}&count=20&exclude={matchup}",
+        "lineups_diverse": f"/lineups?matchup={matchup}&count=150&min_unique=2&max_exposure=50",
+        "lineups_csv": f"/lineups.csv?matchup={matchup}&count=150&min_unique=1",
+        "api_players": f"/api/players?matchup={matchup}",
+        "api_lineups": f"/api/lineups?matchup={matchup}&count=150",
+    }
+    client.get(paths["lineups_cached"])    # warm the lineup cache for this slate
+
+    def fetch(path, headers=None):
+        # page and API caches are cleared so each route pays for its own render
+        app.player_page.cache_clear()
+        app.cached_lineup_page.cache_clear()
+        app.api_body.cache_clear()
+        return client.get(path, headers=headers).get_data()
+
+    for name, path in paths.items():
+        _, timing = timed(lambda: fetch(path), repeat)
+        results.append({"bench": "route", "route": name, "path": path, **timing})
+    path = paths["lineups_uncached"]
+    client.get(path)
+    _, timing = timed(lambda: client.get(path).get_data(), repeat)
+    results.append({"bench": "route", "route": "lineups_page_cached", "path": path, **timing})
+    path = paths["api_lineups"]
+    etag = client.get(path).headers["ETag"]
+    _, timing = timed(lambda: client.get(path, headers={"If-None-Match": etag}).get_data(), repeat)
+    results.append({"bench": "route", "route": "api_not_modified", "path": path, **timing})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the optimizer, sheet parsing and page routes offline.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write JSON results here instead of stdout")
+    parser.add_argument("--skip-routes", action="store_true")
+    args = parser.parse_args(argv)
+
+    results, checks = [], []
+    check_reference(checks)
+    check_diverse_cost(checks, args.repeat)
+    check_solver_slots(checks)
+    check_api_etag(checks)
+    bench_optimizer(results, args.repeat)
+    bench_pipeline(results, args.repeat)
+    if not args.skip_routes:
+        bench_routes(results, args.repeat)
+    report = {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+              "results": results, "checks": checks}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+    failed = [c for c in checks if not c["passed"]]
+    for check in failed:
+        print(f"FAILED {check['check']} players={check['players']} variant={check['variant']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,244 @@
+import argparse
+import json
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from optimizer import DK_SHOWDOWN, ROSTER_FORMATS, PlayerTable, generate_all_lineups
+from simulation import SIM_CHUNK, SIMULATIONS, lineup_weights, simulate_players, split_lineup
+from slate import GOOGLE_SHEET_CSV_URLS, SlateStore
+
+FIELD_ENTRIES = 5000
+ENTRY_FEE = 1.0
+RAKE = 0.15    # share of the entry fees the site keeps
+PAID_FRACTION = 0.2
+MIN_CASH = 1.5    # smallest prize, in entry fees
+FIELD_MIN_SALARY = 0.95    # share of the cap a field lineup spends at least
+FIELD_OWN_FLOOR = 0.1    # percent; players the sheet gives no ownership still get drawn now and then
+FIELD_BATCH = 1000    # smallest number of field lineups drawn per attempt
+FIELD_ATTEMPTS = 50
+FIELD_CELLS = 1_000_000    # simulated field scores held at once (sims x field lineups)
+
+# payouts are ((last place, prize), ...) tiers in finishing order, e.g.
+# ((1, 1000.0), (2, 500.0), (10, 50.0), (100, 5.0)) pays places 3-10 50 each
+Contest = namedtuple("Contest", ["entries", "entry_fee", "payouts"])
+
+
+def gpp_contest(entries=FIELD_ENTRIES, entry_fee=ENTRY_FEE, rake=RAKE, paid_fraction=PAID_FRACTION,
+                min_cash=MIN_CASH):
+    # A top-heavy tournament: every paid place gets min_cash entry fees and the
+    # rest of the prize pool is shared out falling off as 1 / place.
+    paid = max(1, int(entries * paid_fraction))
+    pool = entries * entry_fee * (1 - rake)
+    floor = min(min_cash * entry_fee, pool / paid)
+    share = 1.0 / np.arange(1, paid + 1)
+    prizes = np.round(floor + (pool - floor * paid) * share / share.sum(), 2)
+    return Contest(entries, entry_fee, tuple((place, float(prize)) for place, prize in enumerate(prizes, 1)))
+
+
+def place_prizes(contest):
+    # prize for each finishing place, 1 through contest.entries
+    prizes = np.zeros(contest.entries)
+    first = 0
+    for last, prize in contest.payouts:
+        last = min(int(last), contest.entries)
+        prizes[first:last] = prize
+        first = max(first, last)
+    return prizes
+
+
+def _field_weights(table):
+    # sampling weight per player: projected ownership, or the projection when the
+    # sheet has no ownership column; players projected for nothing are never drawn
+    if table.own.any():
+        weights = np.maximum(table.own, FIELD_OWN_FLOOR)
+    else:
+        weights = np.clip(table.proj, 0.0, None)
+    weights = np.where(table.proj > 0, weights, 0.0)
+    with np.errstate(divide="ignore"):
+        return np.log(weights)
+
+
+def sample_field(table, entries, seed=None, min_salary=FIELD_MIN_SALARY):
+    # (lead ids, flex ids) of entries opponent lineups. Lineups are filled one slot
+    # at a time, leads first, each pick drawn in proportion to projected ownership
+    # among the players that still leave room under the cap for the cheapest way
+    # to fill the remaining slots and its position quotas. Draws that end up
+    # spending under min_salary of the cap are thrown back.
+    rng = np.random.default_rng(seed)
+    roster = table.roster
+    log_weights = _field_weights(table)
+    drawable = np.isfinite(log_weights)
+    player_positions = table.positions[table.pos_codes]
+    steps = []    # (salary paid, eligible players) per slot, in fill order
+    for s, (slot, eligible) in enumerate(zip(roster.slots, table.slot_eligible)):
+        mask = eligible & drawable
+        if s == 0:
+            mask &= table.salary > roster.min_captain_salary
+        if not mask.any():
+            raise ValueError(f"no player can fill {slot.name} in the field")
+        steps.append((table.slot_salary[s], mask))
+    flex_mask = table.flex_eligible & drawable
+    k = roster.flex_slots
+    if flex_mask.sum() < k:
+        raise ValueError(f"not enough players to fill {roster.flex_name} in the field")
+    steps += [(table.salary, flex_mask)] * k
+    # cheapest salary the slots after each step can be filled for
+    cheapest = [salary[mask].min() for salary, mask in steps[:len(roster.slots)]]
+    cheapest += list(np.sort(table.salary[flex_mask])[:k])
+    reserve = np.concatenate([np.cumsum(cheapest[::-1])[::-1][1:], [0.0]])
+    quotas = [(player_positions == position, need) for position, need in roster.flex_minimums.items()]
+    # a pool priced for another site may not come near the cap; its field is
+    # only held to the cap itself
+    floor = min_salary * roster.salary_cap if sum(sorted(table.salary)[-roster.size:]) >= roster.salary_cap else 0.0
+
+    leads_out, flex_out = [], []
+    have = 0
+    for _ in range(FIELD_ATTEMPTS):
+        size = max(2 * (entries - have), FIELD_BATCH)
+        rows = np.arange(size)
+        picks = np.empty((size, len(steps)), dtype=np.intp)
+        taken = np.zeros((size, len(table)), dtype=bool)
+        budget = np.full(size, float(roster.salary_cap))
+        needs = np.array([[need for _, need in quotas]] * size, dtype=int).reshape(size, len(quotas))
+        valid = np.ones(size, dtype=bool)
+        for step, (salary, mask) in enumerate(steps):
+            allowed = mask & ~taken & (salary <= (budget - reserve[step])[:, None])
+            flex_left = len(steps) - step
+            if quotas and flex_left <= k:
+                # once the open slots only just cover the quotas, only quota positions are drawn
+                short = np.flatnonzero(np.clip(needs, 0, None).sum(axis=1) >= flex_left)
+                wanted = np.zeros((len(short), len(table)), dtype=bool)
+                for q, (at_position, _) in enumerate(quotas):
+                    wanted |= at_position & (needs[short, q:q + 1] > 0)
+                allowed[short] &= wanted
+            keys = np.where(allowed, log_weights + rng.gumbel(size=allowed.shape), -np.inf)
+            pick = keys.argmax(axis=1)
+            valid &= allowed[rows, pick]
+            picks[:, step] = pick
+            taken[rows, pick] = True
+            budget -= salary[pick]
+            if flex_left <= k:
+                for q, (at_position, _) in enumerate(quotas):
+                    needs[:, q] -= at_position[pick]
+        valid &= roster.salary_cap - budget >= floor
+        leads_out.append(picks[valid, :len(roster.slots)])
+        flex_out.append(picks[valid, len(roster.slots):])
+        have += int(valid.sum())
+        if have >= entries:
+            return np.concatenate(leads_out)[:entries], np.concatenate(flex_out)[:entries]
+    raise ValueError("could not draw a field of valid lineups from this player pool")
+
+
+def _standings(field, scores):
+    # field is (sims, field lineups) and scores (sims, lineups); returns how many
+    # field lineups beat and tie each score. Rows are sorted and shifted apart so
+    # one searchsorted over the flattened field ranks every row at once.
+    field = np.sort(field, axis=1)
+    sims, size = field.shape
+    gap = max(field[:, -1].max(), scores.max()) + 1.0
+    shift = np.arange(sims)[:, None] * gap
+    flat = (field + shift).ravel()
+    start = np.arange(sims)[:, None] * size
+    below = np.searchsorted(flat, scores + shift, side="left") - start
+    not_above = np.searchsorted(flat, scores + shift, side="right") - start
+    return size - not_above, not_above - below
+
+
+def _contest_sums(table, field_leads, field_flex, lead_ids, flex_ids, prizes, n_sims, seed):
+    # totals over n_sims simulated games of (place, payout, cash, win) per lineup;
+    # tied lineups split the places they share and the prizes for them
+    field_weights = lineup_weights(table, field_leads, field_flex)
+    weights = lineup_weights(table, lead_ids, flex_ids)
+    paid = np.concatenate([[0.0], np.cumsum(prizes)])
+    rows = max(1, FIELD_CELLS // field_weights.shape[1])
+    totals = np.zeros((4, weights.shape[1]))
+    for outcomes in simulate_players(table, n_sims, seed):
+        for start in range(0, len(outcomes), rows):
+            block = outcomes[start:start + rows]
+            above, tied = _standings(block @ field_weights, block @ weights)
+            payout = (paid[above + tied + 1] - paid[above]) / (tied + 1)
+            totals[0] += (above + 1 + tied / 2).sum(axis=0)
+            totals[1] += payout.sum(axis=0)
+            totals[2] += (payout > 0).sum(axis=0)
+            totals[3] += ((above == 0) / (tied + 1)).sum(axis=0)
+    return totals
+
+
+def evaluate_contest(table, lead_ids, flex_ids, contest=None, n_sims=SIMULATIONS, seed=None, processes=1):
+    # Plays each lineup against a simulated field of contest.entries - 1 opponents
+    # drawn from projected ownership, and returns per lineup arrays of expected
+    # finishing place, payout and ROI along with cash and win rates. Games are
+    # simulated in SIM_CHUNK batches with their own seeds, so the result does not
+    # depend on processes, which spreads the batches over a process pool.
+    contest = contest or gpp_contest()
+    seeds = np.random.SeedSequence(seed)
+    field_leads, field_flex = sample_field(table, contest.entries - 1, seeds.spawn(1)[0])
+    prizes = place_prizes(contest)
+    batches = [min(SIM_CHUNK, n_sims - start) for start in range(0, n_sims, SIM_CHUNK)]
+    args = (table, field_leads, field_flex, lead_ids, flex_ids, prizes)
+    batch_seeds = seeds.spawn(len(batches))
+    processes = min(processes or os.cpu_count() or 1, len(batches))
+    if processes > 1:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            futures = [pool.submit(_contest_sums, *args, size, s) for size, s in zip(batches, batch_seeds)]
+            totals = sum(f.result() for f in futures)
+    else:
+        totals = sum(_contest_sums(*args, size, s) for size, s in zip(batches, batch_seeds))
+    place, payout, cash, win = totals / n_sims
+    return {"place": place, "top": place / contest.entries, "payout": payout,
+            "roi": (payout - contest.entry_fee) / contest.entry_fee, "cash": cash, "win": win}
+
+
+def add_contest(df, lineups, contest=None, n_sims=SIMULATIONS, seed=None, roster=DK_SHOWDOWN, processes=1):
+    # returns copies of the generate_all_lineups dicts with a "Contest" summary each
+    if not lineups:
+        return lineups
+    table = PlayerTable.from_frame(df, roster)
+    lead_ids, flex_ids = zip(*(split_lineup(table, lu) for lu in lineups))
+    stats = evaluate_contest(table, lead_ids, flex_ids, contest, n_sims, seed, processes)
+    return [dict(lu, Contest={key: float(values[i]) for key, values in stats.items()})
+            for i, lu in enumerate(lineups)]
+
+
+def parse_payouts(text):
+    # "1:1000,2:500,10:50" -> ((1, 1000.0), (2, 500.0), (10, 50.0))
+    tiers = []
+    for tier in text.split(","):
+        place, prize = tier.split(":")
+        tiers.append((int(place), float(prize)))
+    return tuple(sorted(tiers))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play generated lineups against a simulated contest field.")
+    parser.add_argument("matchup")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--format", default="dk_showdown", choices=sorted(ROSTER_FORMATS))
+    parser.add_argument("--entries", type=int, default=FIELD_ENTRIES)
+    parser.add_argument("--entry-fee", type=float, default=ENTRY_FEE)
+    parser.add_argument("--payouts", default=None, help="place:prize tiers, e.g. 1:1000,2:500,10:50")
+    parser.add_argument("--sims", type=int, default=SIMULATIONS)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    df = SlateStore(GOOGLE_SHEET_CSV_URLS).players_for(args.matchup)
+    if df.empty:
+        parser.error(f"no players for matchup {args.matchup!r}")
+    roster = ROSTER_FORMATS[args.format]
+    if args.payouts:
+        contest = Contest(args.entries, args.entry_fee, parse_payouts(args.payouts))
+    else:
+        contest = gpp_contest(args.entries, args.entry_fee)
+    lineups = generate_all_lineups(df, max_lineups=args.count, roster=roster)
+    for lu in add_contest(df, lineups, contest, args.sims, args.seed, roster, args.processes):
+        json.dump(lu, sys.stdout)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+
+# Threaded workers: a request waiting on a sheet download only parks its own
+# thread, while optimization runs in each worker's solver process pool (solver.py)
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+threads = int(os.environ.get("GUNICORN_THREADS", 16))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+graceful_timeout = 30
+keepalive = 5
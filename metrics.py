@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import contextmanager
+
+PREFIX = "nflshowdown"
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, key, value) for key, value in sorted(self.values.items())]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.values)
+
+    def add(self, values):
+        with self._lock:
+            for key, amount in values.items():
+                self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = f"{PREFIX}_{name}"
+        self.help = help
+        self.buckets = buckets
+        self.values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, n = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value, n + 1)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total, n) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    out.append((f"{self.name}_bucket", key + (("le", repr(bound)),), count))
+                out.append((f"{self.name}_bucket", key + (("le", "+Inf"),), n))
+                out.append((f"{self.name}_sum", key, total))
+                out.append((f"{self.name}_count", key, n))
+        return out
+
+
+STAGE_SECONDS = Histogram("stage_seconds", "Time spent in each stage of serving a request.")
+REQUEST_SECONDS = Histogram("request_seconds", "End-to-end request latency by route.")
+CACHE_REQUESTS = Counter("cache_requests_total", "Cache lookups by cache and result (hit/miss).")
+SHEET_FETCHES = Counter("sheet_fetches_total", "Sheet downloads by result (changed/unchanged/not_modified/failed).")
+SHEET_FETCH_FAILURES = Counter("sheet_fetch_failures_total", "Failed sheet downloads or parses by URL.")
+CANDIDATES_EVALUATED = Counter("candidates_evaluated_total", "Candidate lineups scored by the optimizer.")
+SOLVER_REJECTED = Counter("solver_rejected_total", "Optimization requests turned away because the solver queue was full.")
+CANDIDATES_PRUNED = Counter("candidates_pruned_total", "Search branches cut by salary, projection, ownership or rule bounds.")
+FLEX_DOMINATED = Counter("flex_dominated_total", "FLEX players dropped before the search as dominated on salary and value.")
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
+
+def counter_values():
+    return {metric.name: metric.snapshot() for metric in _registry if metric.kind == "counter"}
+
+
+def counts_since(before):
+    # what each counter gained since counter_values() returned before; a worker
+    # process sends this back so the web process can add it to its own counters
+    counts = {}
+    for name, values in counter_values().items():
+        old = before.get(name, {})
+        gained = {key: value - old.get(key, 0) for key, value in values.items() if value != old.get(key, 0)}
+        if gained:
+            counts[name] = gained
+    return counts
+
+
+def add_counts(counts):
+    for metric in _registry:
+        if metric.kind == "counter" and metric.name in counts:
+            metric.add(counts[metric.name])
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{_label_text(labels)} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,766 @@
+import heapq
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from itertools import combinations, count
+
+import numpy as np
+
+from metrics import CACHE_REQUESTS, CANDIDATES_EVALUATED, CANDIDATES_PRUNED, FLEX_DOMINATED
+
+SALARY_CAP = 50000
+CPT_MULTIPLIER = 1.5
+MIN_CPT_SALARY = 5000    # Captain must be more than $5,000
+FLEX_SLOTS = 5
+SCRIPT_CPT_POSITIONS = {"run": ["RB"], "pass": ["QB", "WR", "TE"]}
+DIVERSE_POOL_FACTOR = 4    # candidates searched per requested lineup in diverse mode
+DIVERSE_POOL_GROWTH = 4    # pool growth when a diverse round runs dry with no new player capped
+DIVERSE_MAX_POOL = 100000
+BATCH_DEPTH = 1    # the last FLEX slot(s) are scored as one NumPy batch per search node
+WARM_START_HISTORY = 32    # earlier solves kept per slate for warm starts
+OWN_TOLERANCE = 1e-6    # ownership sums are floats; a lineup exactly at the cap fits
+
+OFFENSE_POSITIONS = ("QB", "RB", "WR", "TE")
+DST_POSITIONS = ("DST", "DEF", "D/ST", "D")
+# Named stacking rules offered by the app and the batch CLI. A rule is a dict:
+#   {"rule": "cpt_stack", "cpt": [positions], "with": [positions], "min": n}
+#       a captain at one of the cpt positions needs n same-team FLEX at the with positions
+#   {"rule": "max_per_team", "max": n}   at most n players (captain included) from one team
+#   {"rule": "no_opposing_dst"}          no DST facing an offensive captain
+STACK_RULES = {
+    "qb_stack": {"rule": "cpt_stack", "cpt": ["QB"], "with": ["WR", "TE"], "min": 2},
+    "no_opposing_dst": {"rule": "no_opposing_dst"},
+}
+
+# A lead slot takes one player at its own points and salary multipliers;
+# positions limits who may fill it (None: anyone)
+Slot = namedtuple("Slot", ["name", "points", "salary", "positions"])
+
+
+class RosterFormat:
+    # A contest's roster: the lead slots (CPT, MVP/STAR/PRO, or a classic
+    # roster's QB and DST), each filled by one player, then flex_slots
+    # interchangeable slots open to flex_positions. flex_minimums are position
+    # quotas the flex players must cover. The first lead slot is the one the
+    # captain options (lock_cpt, scripts, cpt_stack rules) apply to.
+    def __init__(self, name, salary_cap, slots, flex_slots, flex_name="FLEX", flex_positions=None,
+                 flex_minimums=None, min_captain_salary=0, header=None):
+        self.name = name
+        self.salary_cap = salary_cap
+        self.slots = tuple(slots)
+        self.flex_slots = flex_slots
+        self.flex_name = flex_name
+        self.flex_positions = flex_positions
+        self.flex_minimums = dict(flex_minimums or {})
+        self.min_captain_salary = min_captain_salary
+        self.size = len(self.slots) + flex_slots
+        # roles in the order the site's upload file lists them
+        self.header = tuple(header or [slot.name for slot in self.slots] + [flex_name] * flex_slots)
+
+    def flex_roles(self, positions):
+        # labels flex players with the position quota each one fills, the rest as flex
+        left = dict(self.flex_minimums)
+        roles = []
+        for position in positions:
+            if left.get(position, 0) > 0:
+                left[position] -= 1
+                roles.append(position)
+            else:
+                roles.append(self.flex_name)
+        return roles
+
+
+DK_SHOWDOWN = RosterFormat("DraftKings Showdown", SALARY_CAP, [Slot("CPT", CPT_MULTIPLIER, CPT_MULTIPLIER, None)],
+                           FLEX_SLOTS, min_captain_salary=MIN_CPT_SALARY)
+ROSTER_FORMATS = {
+    "dk_showdown": DK_SHOWDOWN,
+    "fd_single_game": RosterFormat("FanDuel Single Game", 60000, [Slot("MVP", 1.5, 1.0, None)], 4),
+    "fd_mvp_star_pro": RosterFormat("FanDuel MVP/STAR/PRO", 60000,
+                                    [Slot("MVP", 2.0, 1.0, None), Slot("STAR", 1.5, 1.0, None),
+                                     Slot("PRO", 1.2, 1.0, None)], 2, flex_name="UTIL"),
+    "dk_classic": RosterFormat("DraftKings Classic", SALARY_CAP,
+                               [Slot("QB", 1.0, 1.0, ("QB",)), Slot("DST", 1.0, 1.0, DST_POSITIONS)], 7,
+                               flex_positions=("RB", "WR", "TE"), flex_minimums={"RB": 2, "WR": 3, "TE": 1},
+                               header=("QB", "RB", "RB", "WR", "WR", "WR", "TE", "FLEX", "DST")),
+}
+
+
+def cpt_salary(salary, multiplier=CPT_MULTIPLIER):
+    salary = np.asarray(salary, dtype=float)
+    return salary if multiplier == 1 else np.round(salary * multiplier, -2)
+
+
+class PlayerTable:
+    # The slate compiled for one roster format: per lead slot salary, projection
+    # and eligibility arrays, so the search never looks at the format itself.
+    def __init__(self, names, teams, positions, salary, proj, own=None, roster=DK_SHOWDOWN):
+        self.names = list(names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.salary = np.asarray(salary, dtype=float)
+        self.proj = np.asarray(proj, dtype=float)
+        self.own = np.zeros(len(self.names)) if own is None else np.nan_to_num(np.asarray(own, dtype=float))
+        self.teams, self.team_codes = np.unique(np.asarray(teams, dtype=str), return_inverse=True)
+        self.positions, self.pos_codes = np.unique(np.asarray(positions, dtype=str), return_inverse=True)
+        self.roster = roster
+        player_positions = self.positions[self.pos_codes]
+        self.slot_salary = [cpt_salary(self.salary, slot.salary) for slot in roster.slots]
+        self.slot_proj = [self.proj * slot.points for slot in roster.slots]
+        self.slot_eligible = [np.ones(len(self.names), dtype=bool) if slot.positions is None
+                              else np.isin(player_positions, slot.positions) for slot in roster.slots]
+        self.flex_eligible = (np.ones(len(self.names), dtype=bool) if roster.flex_positions is None
+                              else np.isin(player_positions, roster.flex_positions))
+
+    @classmethod
+    def from_frame(cls, df, roster=DK_SHOWDOWN):
+        df = df.drop_duplicates(subset=["Name"])
+        own = df["Own"] if "Own" in df else None
+        return cls(df["Name"], df["Team"], df["POS"], df["Salary"], df["Proj"], own, roster)
+
+    def __len__(self):
+        return len(self.names)
+
+    def ids(self, names):
+        return [self.index[name] for name in names if name in self.index]
+
+    def ids_at(self, positions):
+        return np.flatnonzero(np.isin(self.positions[self.pos_codes], positions))
+
+    def values(self, leverage=0.0):
+        # (flex, [lead slot, ...]) objective per player: projection less leverage
+        # points per percent of projected ownership
+        if not leverage:
+            return self.proj, self.slot_proj
+        return self.proj - leverage * self.own, [proj - leverage * self.own for proj in self.slot_proj]
+
+
+def _suffix_min_salaries(salaries, k):
+    # suffix_min[r][i] = cheapest possible total for r players taken from salaries[i:]
+    n = len(salaries)
+    inf = float("inf")
+    suffix_min = [[0.0] * (n + 1)] + [[inf] * (n + 1) for _ in range(k)]
+    smallest = []
+    for i in range(n - 1, -1, -1):
+        smallest = sorted(smallest + [salaries[i]])[:k]
+        total = 0.0
+        for r, s in enumerate(smallest, start=1):
+            total += s
+            suffix_min[r][i] = total
+    return suffix_min
+
+
+def _combination_block(n, r):
+    # every r-subset of range(n) in lexicographic order, plus the offset at which
+    # subsets whose first member is >= i begin
+    if r == 1:
+        members = np.arange(n, dtype=np.intp)[:, None]
+    elif r == 2:
+        i, j = np.triu_indices(n, k=1)
+        members = np.stack([i, j], axis=1).astype(np.intp)
+    else:
+        members = np.array(list(combinations(range(n), r)), dtype=np.intp).reshape(-1, r)
+    starts = np.searchsorted(members[:, 0], np.arange(n + 1))
+    return members, starts
+
+
+def _undominated(table, pool, values, depth, own_cap=None, groups=None):
+    # Drops FLEX players that cannot appear in any of the top lineups. If q costs
+    # no more than p, scores at least as much (and, under an ownership cap, is
+    # owned no more), swapping p out for q keeps any lineup feasible and no worse.
+    # Besides p a lineup seats k-1 other FLEX picks and its lead players, so with
+    # depth = max_lineups + those seats kept dominators every lineup holding p has
+    # max_lineups others at least as good. groups, when given, limits dominators
+    # to p's own group (team and position under stacking rules, position under
+    # position quotas) so the swap cannot break a rule. Players are visited
+    # dominators-first, so each decision only relies on kept players.
+    if len(pool) <= depth:
+        return pool
+    order = np.lexsort((table.own[pool], table.salary[pool], -values[pool]))
+    ranked = pool[order]
+    salary = table.salary[ranked]
+    value = values[ranked]
+    dominates = (salary[None, :] <= salary[:, None]) & (value[None, :] >= value[:, None])
+    dominates &= np.tri(len(ranked), k=-1, dtype=bool)
+    if own_cap is not None:
+        own = table.own[ranked]
+        dominates &= own[None, :] <= own[:, None]
+    if groups is not None:
+        group = groups[ranked]
+        dominates &= group[None, :] == group[:, None]
+    kept = np.ones(len(ranked), dtype=bool)
+    for p in np.flatnonzero(dominates.sum(axis=1) >= depth).tolist():
+        if np.count_nonzero(dominates[p] & kept) >= depth:
+            kept[p] = False
+    keep = np.zeros(len(pool), dtype=bool)
+    keep[order[kept]] = True
+    return pool[keep]
+
+
+class _StackRules:
+    # Stacking rules resolved against one player table. for_captain() turns them
+    # into the masks the FLEX search prunes on, so restrictive rules shrink the
+    # search instead of filtering its output. The roster's flex position quotas
+    # are compiled in as stacks every captain needs.
+    def __init__(self, table, rules):
+        self.table = table
+        self.team_cap = table.roster.size
+        self.no_opposing_dst = False
+        self.stacks = []
+        positions = table.positions[table.pos_codes]
+        self.offense = np.isin(positions, OFFENSE_POSITIONS)
+        self.dst = np.isin(positions, DST_POSITIONS)
+        self.quotas = [(np.isin(positions, [position]), minimum)
+                       for position, minimum in table.roster.flex_minimums.items()]
+        for rule in rules:
+            kind = rule.get("rule")
+            if kind == "cpt_stack":
+                self.stacks.append((np.isin(positions, rule["cpt"]), np.isin(positions, rule["with"]),
+                                    int(rule.get("min", 1))))
+            elif kind == "max_per_team":
+                self.team_cap = min(self.team_cap, int(rule["max"]))
+            elif kind == "no_opposing_dst":
+                self.no_opposing_dst = True
+            else:
+                raise ValueError(f"unknown stacking rule {kind!r}")
+
+    def for_captain(self, cpt):
+        # returns (banned, team_cap, [(qualifying, min), ...]) with the masks over
+        # player ids; they cover every slot but the captain's
+        teams = self.table.team_codes
+        banned = np.zeros(len(self.table), dtype=bool)
+        if self.no_opposing_dst and self.offense[cpt]:
+            banned = self.dst & (teams != teams[cpt])
+        stacks = [((teams == teams[cpt]) & with_positions, minimum)
+                  for cpt_positions, with_positions, minimum in self.stacks if cpt_positions[cpt]]
+        return banned, self.team_cap, stacks + self.quotas
+
+    def allows(self, leads, flex_ids):
+        banned, team_cap, stacks = self.for_captain(leads[0])
+        others = list(leads[1:]) + list(flex_ids)
+        if banned[others].any():
+            return False
+        if np.bincount(self.table.team_codes[[leads[0]] + others]).max() > team_cap:
+            return False
+        return all(mask[others].sum() >= minimum for mask, minimum in stacks)
+
+
+class _TopLineups:
+    # Bounded top-K collector: a min-heap of at most size (score, tiebreak,
+    # (lead ids, flex ids)) entries, so memory stays flat however many lineups
+    # the search scores. Player ids stay plain ints here; names and teams are
+    # only looked up for the lineups finally returned.
+    def __init__(self, size):
+        self.size = size
+        self.heap = []
+        self.tiebreak = count()
+        self.threshold = float("-inf")
+        self.keys = None
+
+    def seed(self, lineups):
+        # starts the heap from known (score, lineup) pairs; the search will find
+        # them again, so from here on lineups already in the heap are skipped.
+        # Only the heap's own lineups are remembered: one that was pushed out
+        # scores at or below the threshold and cannot get back in anyway.
+        self.keys = set()
+        for score, lineup in lineups:
+            self.push(score, lineup)
+
+    def push(self, score, lineup):
+        key = None
+        if self.keys is not None:
+            key = (lineup[0], frozenset(lineup[1]))
+            if key in self.keys:
+                return
+        entry = (score, -next(self.tiebreak), lineup)
+        if len(self.heap) < self.size:
+            heapq.heappush(self.heap, entry)
+        elif score > self.heap[0][0]:
+            evicted = heapq.heapreplace(self.heap, entry)[2]
+            if key is not None:
+                self.keys.discard((evicted[0], frozenset(evicted[1])))
+        else:
+            return
+        if key is not None:
+            self.keys.add(key)
+        if len(self.heap) == self.size:
+            self.threshold = self.heap[0][0]
+
+    def results(self):
+        return [(score, lineup) for score, _, lineup in sorted(self.heap, reverse=True)]
+
+
+class _FlexSearch:
+    # Branch and bound over FLEX ids sorted by value (projection, or projection
+    # less the ownership penalty) descending, so the next r players always give
+    # the best value any completion can reach. Ownership, when capped, is pruned
+    # on exactly like salary.
+    def __init__(self, table, pool, k, values, own_cap=None):
+        self.pool = np.asarray(pool, dtype=np.intp)
+        self.k = k
+        self.ids = self.pool.tolist()
+        self.pool_position = {player: i for i, player in enumerate(self.ids)}
+        self.salaries = table.salary[self.pool].tolist()
+        self.projs = values[self.pool].tolist()
+        self.suffix_min = _suffix_min_salaries(self.salaries, k)
+        self.prefix = np.concatenate([[0.0], np.cumsum(values[self.pool])]).tolist()
+        self.own_cap = own_cap
+        self.own_budget = None
+        if own_cap is not None:
+            self.owns = table.own[self.pool].tolist()
+            self.suffix_min_own = _suffix_min_salaries(self.owns, k)
+        self.team_codes = table.team_codes[self.pool]
+        self.teams = self.team_codes.tolist()
+        self.n_teams = len(table.teams)
+        self.all_team_codes = table.team_codes
+        self.roster_size = table.roster.size
+        self.evaluated = 0
+        self.pruned = 0
+        depth = min(k, BATCH_DEPTH)
+        self.block = None
+        if depth:
+            members, starts = _combination_block(len(self.pool), depth)
+            self.block = (members, starts, table.salary[self.pool][members].sum(axis=1),
+                          values[self.pool][members].sum(axis=1))
+            if own_cap is not None:
+                self.block_own = table.own[self.pool][members].sum(axis=1)
+
+    def run(self, leads, locked, budget, base, top, rules=None, own_budget=None):
+        # leads holds the lead slot players (the captain first), which the FLEX
+        # picks skip. rules is a _StackRules; its constraints are checked on every
+        # partial lineup. own_budget is the ownership the FLEX picks may still add
+        # under the cap.
+        self.own_budget = own_budget
+        self.leads = leads
+        self.locked = tuple(locked)
+        self.budget = budget
+        self.base = base
+        self.top = top
+        self.chosen = []
+        self.blocked = tuple(self.pool_position[i] for i in leads if i in self.pool_position)
+        counts, needs = None, ()
+        if rules is not None:
+            state = self._compile(rules, leads)
+            if state is None:
+                self.pruned += 1
+                return
+            counts, needs = state
+        if self.k == 0:
+            top.push(base, (leads, self.locked))
+        else:
+            self._visit(0, self.k, 0.0, 0.0, counts, needs, 0.0)
+
+    def _compile(self, rules, leads):
+        # Sets up the per-captain rule masks in pool order and returns the starting
+        # (team counts, stacks still needed), or None when the leads and locks
+        # can never satisfy the rules. The other lead slots count like locks.
+        banned, self.team_cap, stacks = rules.for_captain(leads[0])
+        locked = list(leads[1:]) + list(self.locked)
+        if banned[locked].any():
+            return None
+        counts = np.bincount(self.all_team_codes[[leads[0]] + locked], minlength=self.n_teams)
+        if counts.max() > self.team_cap:
+            return None
+        self.banned_mask = banned[self.pool]
+        self.banned = self.banned_mask.tolist()
+        self.qualifying = []
+        self.qualifying_masks = []
+        self.need_suffix = []
+        needs = []
+        for mask, minimum in stacks:
+            need = minimum - int(mask[locked].sum())
+            if need <= 0:
+                continue
+            qualifying = mask[self.pool] & ~self.banned_mask
+            qualifying[list(self.blocked)] = False
+            # need_suffix[i] = qualifying players left from pool position i on
+            suffix = np.concatenate([np.cumsum(qualifying[::-1])[::-1], [0]]).tolist()
+            if need > self.k or need > suffix[0]:
+                return None
+            self.qualifying_masks.append(qualifying)
+            self.qualifying.append(qualifying.astype(int).tolist())
+            self.need_suffix.append(suffix)
+            needs.append(need)
+        if not needs and not banned.any() and self.team_cap >= self.roster_size:
+            # nothing applies to this captain, so it takes the unconstrained search
+            return None, ()
+        if self.base + self._rule_bound(counts, needs) <= self.top.threshold:
+            return None
+        return tuple(counts.tolist()), tuple(needs)
+
+    def _rule_bound(self, counts, needs):
+        # Best FLEX projection reachable under the rules, ignoring salary. Each
+        # rule alone is solved exactly by a greedy pass over the pool (sorted by
+        # projection), so the smallest of those is a valid bound for all of them.
+        eligible = ~self.banned_mask
+        eligible[list(self.blocked)] = False
+        projs = np.asarray(self.projs)[eligible]
+        bound = projs[:self.k].sum()
+        if self.team_cap < self.roster_size:
+            rank = np.zeros(len(projs), dtype=int)
+            teams = self.team_codes[eligible]
+            for team in range(self.n_teams):
+                on_team = teams == team
+                rank[on_team] = np.arange(on_team.sum())
+            allowed = rank < self.team_cap - counts[teams]
+            bound = min(bound, projs[allowed][:self.k].sum())
+        for need, qualifying in zip(needs, self.qualifying_masks):
+            taken = np.flatnonzero(qualifying[eligible])[:need]
+            rest = np.delete(projs, taken)
+            bound = min(bound, projs[taken].sum() + rest[:self.k - need].sum())
+        return float(bound)
+
+    def _visit(self, start, remaining, salary, proj, counts=None, needs=(), own=0.0):
+        if remaining <= BATCH_DEPTH:
+            self._finish(start, salary, proj, counts, needs, own)
+            return
+        n = len(self.ids)
+        suffix_min, prefix = self.suffix_min, self.prefix
+        for i in range(start, n - remaining + 1):
+            if salary + suffix_min[remaining][i] > self.budget:
+                self.pruned += 1
+                return
+            if self.base + proj + prefix[i + remaining] - prefix[i] <= self.top.threshold:
+                self.pruned += 1
+                return
+            if i in self.blocked:
+                continue
+            if salary + self.salaries[i] + suffix_min[remaining - 1][i + 1] > self.budget:
+                self.pruned += 1
+                continue
+            next_own = own
+            if self.own_budget is not None:
+                if own + self.suffix_min_own[remaining][i] > self.own_budget:
+                    self.pruned += 1
+                    return
+                next_own = own + self.owns[i]
+                if next_own + self.suffix_min_own[remaining - 1][i + 1] > self.own_budget:
+                    self.pruned += 1
+                    continue
+            next_counts, next_needs = counts, needs
+            if counts is not None:
+                team = self.teams[i]
+                if self.banned[i] or counts[team] >= self.team_cap:
+                    self.pruned += 1
+                    continue
+                next_counts = counts[:team] + (counts[team] + 1,) + counts[team + 1:]
+                if needs:
+                    if any(need > suffix[i] for need, suffix in zip(needs, self.need_suffix)):
+                        self.pruned += 1
+                        return
+                    next_needs = tuple(need - q[i] for need, q in zip(needs, self.qualifying))
+                    if max(next_needs) > remaining - 1:
+                        self.pruned += 1
+                        continue
+            self.chosen.append(i)
+            self._visit(i + 1, remaining - 1, salary + self.salaries[i], proj + self.projs[i], next_counts,
+                        next_needs, next_own)
+            self.chosen.pop()
+
+    def _finish(self, start, salary, proj, counts=None, needs=(), own=0.0):
+        members, starts, block_salary, block_proj = self.block
+        lo = starts[start]
+        scores = self.base + proj + block_proj[lo:]
+        self.evaluated += len(scores)
+        keep = (block_salary[lo:] <= self.budget - salary) & (scores > self.top.threshold)
+        for blocked in self.blocked:
+            keep &= (members[lo:] != blocked).all(axis=1)
+        if self.own_budget is not None:
+            keep &= self.block_own[lo:] <= self.own_budget - own
+        if counts is not None:
+            tail = members[lo:]
+            keep &= ~self.banned_mask[tail].any(axis=1)
+            tail_teams = self.team_codes[tail]
+            for team, used in enumerate(counts):
+                if used + tail.shape[1] > self.team_cap:
+                    keep &= (tail_teams == team).sum(axis=1) + used <= self.team_cap
+            for need, qualifying in zip(needs, self.qualifying_masks):
+                keep &= qualifying[tail].sum(axis=1) >= need
+        hits = np.flatnonzero(keep)
+        if not len(hits):
+            return
+        hits = hits[np.argsort(-scores[hits], kind="stable")[:self.top.size]]
+        prefix_ids = tuple(self.ids[i] for i in self.chosen)
+        for hit, score in zip(hits.tolist(), scores[hits].tolist()):
+            # hits come best first, so once one misses the heap the rest do too
+            # and their id tuples are never built
+            if score <= self.top.threshold:
+                break
+            tail = tuple(self.pool[members[lo + hit]].tolist())
+            self.top.push(score, (self.leads, self.locked + prefix_ids + tail))
+
+
+def _lead_combos(candidates, values):
+    # candidates[s] holds the player ids open to lead slot s, sorted by values[s]
+    # descending. Yields (total value, lead ids) over distinct players, best
+    # total first; with several lead slots the next-best combinations are
+    # expanded lazily from a heap, so the caller's bound cuts the enumeration.
+    if len(candidates) == 1:
+        yield from ((value, (player,)) for player, value
+                    in zip(candidates[0].tolist(), values[0][candidates[0]].tolist()))
+        return
+    slot_ids = [ids.tolist() for ids in candidates]
+    slot_values = [slot[ids].tolist() for slot, ids in zip(values, candidates)]
+    if not all(slot_ids):
+        return
+    start = (0,) * len(slot_ids)
+    heap = [(-sum(slot[0] for slot in slot_values), start)]
+    seen = {start}
+    while heap:
+        total, position = heapq.heappop(heap)
+        leads = tuple(ids[i] for ids, i in zip(slot_ids, position))
+        if len(set(leads)) == len(leads):
+            yield -total, leads
+        for s, i in enumerate(position):
+            if i + 1 < len(slot_ids[s]):
+                after = position[:s] + (i + 1,) + position[s + 1:]
+                if after not in seen:
+                    seen.add(after)
+                    heapq.heappush(heap, (-sum(slot[j] for slot, j in zip(slot_values, after)), after))
+
+
+def optimize(table, cpt_ids, lock_flex=(), max_lineups=5, salary_cap=None, exclude=(), rules=None,
+             incumbents=(), leverage=0.0, max_ownership=None):
+    # returns the max_lineups best (score, (lead_ids, flex_ids)) pairs under the
+    # cap and stacking rules, best first, for the table's roster format; cpt_ids
+    # limits the first lead slot. incumbents are lineups already known to be
+    # feasible, which set the pruning threshold before the search starts.
+    # The score is the projection, less leverage points per percent of ownership
+    # when leverage is set; max_ownership caps the lineup's summed ownership.
+    roster = table.roster
+    salary_cap = roster.salary_cap if salary_cap is None else salary_cap
+    lock_flex = list(dict.fromkeys(lock_flex))
+    if len(lock_flex) > roster.flex_slots or not table.flex_eligible[lock_flex].all():
+        return []
+    values, slot_values = table.values(leverage)
+    lock_salary = float(table.salary[lock_flex].sum())
+    lock_proj = float(values[lock_flex].sum())
+    lock_own = float(table.own[lock_flex].sum())
+    k = roster.flex_slots - len(lock_flex)
+    unavailable = np.asarray(list(lock_flex) + list(exclude), dtype=np.intp)
+    open_pool = np.setdiff1d(np.flatnonzero(table.flex_eligible), unavailable)
+    open_pool = open_pool[np.argsort(-values[open_pool], kind="stable")]
+    if len(open_pool) < k:
+        return []
+    stack_rules = _StackRules(table, rules or ()) if rules or roster.flex_minimums else None
+    depth = max_lineups + k - 1 + len(roster.slots)
+    groups = None
+    if rules:
+        groups = table.team_codes * len(table.positions) + table.pos_codes
+    elif roster.flex_minimums:
+        groups = table.pos_codes
+    kept = _undominated(table, open_pool, values, depth, max_ownership, groups)
+    FLEX_DOMINATED.inc(len(open_pool) - len(kept))
+    open_pool = kept
+    flex_bound = lock_proj + float(values[open_pool][:k].sum())
+
+    available = np.setdiff1d(np.arange(len(table)), unavailable)
+    candidates = []
+    for slot, eligible in enumerate(table.slot_eligible):
+        ids = available[eligible[available]]
+        if slot == 0:
+            ids = np.intersect1d(ids, np.asarray(cpt_ids, dtype=np.intp))
+            ids = ids[table.salary[ids] > roster.min_captain_salary]
+        candidates.append(ids[np.argsort(-slot_values[slot][ids], kind="stable")])
+
+    search = _FlexSearch(table, open_pool, k, values, max_ownership)
+    top = _TopLineups(max_lineups)
+    if incumbents:
+        top.seed(incumbents)
+    for value, leads in _lead_combos(candidates, slot_values):
+        if value + flex_bound <= top.threshold:
+            search.pruned += 1
+            break
+        budget = salary_cap - lock_salary - sum(float(table.slot_salary[s][player]) for s, player in enumerate(leads))
+        if budget < 0:
+            continue
+        own_budget = None
+        if max_ownership is not None:
+            own_budget = max_ownership + OWN_TOLERANCE - float(table.own[list(leads)].sum()) - lock_own
+            if own_budget < 0:
+                continue
+        search.run(leads, lock_flex, budget, value + lock_proj, top, stack_rules, own_budget)
+    CANDIDATES_EVALUATED.inc(search.evaluated)
+    CANDIDATES_PRUNED.inc(search.pruned)
+    return top.results()
+
+
+def iter_diverse(table, cpt_ids, lock_flex=(), max_lineups=150, min_unique=0, max_exposure=1.0,
+                 salary_cap=None, exempt=(), rules=None, exclude=(), leverage=0.0, max_ownership=None,
+                 search=optimize):
+    # Each round runs one plain top-K search with the players at their exposure
+    # cap left out, then greedily accepts its candidates in score order, skipping
+    # any too close to a lineup already taken. The overlap test stays out of the
+    # branch and bound, so every round keeps dominance pruning and a flat cost
+    # per search node. A round only repeats once its pool runs dry: if more
+    # players were capped meanwhile the same pool size reaches new lineups,
+    # otherwise the pool grows. Exclusions only ever grow, so lineups past a
+    # pool's cutoff score no higher than anything in it and acceptance order is
+    # that of one full ranking. Accepted lineups are final, so they are yielded
+    # as soon as they are taken. search runs each round's top-K search and takes
+    # optimize's arguments, so the rounds can run in another process.
+    exposure_cap = max(1, int(max_exposure * max_lineups))
+    exempt = set(exempt) | set(lock_flex)
+    lineup_size = table.roster.size
+    max_overlap = lineup_size - min_unique
+    exposure = np.zeros(len(table), dtype=int)
+    overlap = np.zeros((len(table), max_lineups), dtype=np.int8)
+    accepted = 0
+    seen = set()
+    capped = []
+    pool_size = max_lineups * DIVERSE_POOL_FACTOR
+    while True:
+        candidates = search(table, cpt_ids, lock_flex, pool_size, salary_cap, exclude=list(exclude) + capped,
+                            rules=rules, leverage=leverage, max_ownership=max_ownership)
+        for score, (leads, flex) in candidates:
+            key = (leads, frozenset(flex))
+            if key in seen:
+                continue
+            seen.add(key)
+            ids = [*leads, *flex]
+            if any(exposure[i] >= exposure_cap for i in ids if i not in exempt):
+                continue
+            if min_unique and accepted and overlap[ids, :accepted].sum(axis=0).max() > max_overlap:
+                continue
+            overlap[ids, accepted] = 1
+            exposure[ids] += 1
+            accepted += 1
+            yield score, (leads, flex)
+            if accepted == max_lineups:
+                return
+        if len(candidates) < pool_size:
+            return
+        now_capped = [i for i in np.flatnonzero(exposure >= exposure_cap).tolist() if i not in exempt]
+        if now_capped == capped:
+            # the same exclusions only give new lineups past this pool's cutoff
+            if pool_size >= DIVERSE_MAX_POOL:
+                return
+            pool_size = min(DIVERSE_POOL_GROWTH * pool_size, DIVERSE_MAX_POOL)
+        capped = now_capped
+
+
+def _rule_key(rule):
+    return json.dumps(rule, sort_keys=True)
+
+
+class WarmStart:
+    # Earlier exact solves on one slate, kept so a small change to the request
+    # does not start from scratch. Scratching a player, adding a lock, narrowing
+    # the captain pool or adding a rule can only remove lineups, so the earlier
+    # top lineups that still qualify are exactly the new top lineups, in order.
+    # When enough of them survive they answer the request outright; otherwise
+    # they seed the search as incumbents. Only solves with the same leverage
+    # score lineups the same way; a lower ownership cap also narrows.
+    def __init__(self, table, size=WARM_START_HISTORY):
+        self.table = table
+        self.teams = table.teams[table.team_codes].tolist()
+        self.size = size
+        self.solves = OrderedDict()    # constraints -> (max_lineups, results)
+        self._lock = threading.Lock()
+
+    def solve(self, cpt_ids, lock_flex, max_lineups, exclude=(), rules=None, leverage=0.0, max_ownership=None,
+              search=optimize):
+        # search runs the fresh solve on a miss; it takes optimize's arguments, so
+        # the caller can send it to another process while the lookup stays here
+        constraints = (frozenset(np.asarray(cpt_ids).tolist()), frozenset(lock_flex), frozenset(exclude),
+                       frozenset(_rule_key(rule) for rule in rules or ()), float(leverage),
+                       float("inf") if max_ownership is None else float(max_ownership))
+        results, incumbents = self._lookup(constraints, max_lineups, rules)
+        if results is not None:
+            CACHE_REQUESTS.inc(cache="warm_start", result="hit")
+            return results
+        CACHE_REQUESTS.inc(cache="warm_start", result="seeded" if incumbents else "miss")
+        results = search(self.table, cpt_ids, lock_flex, max_lineups, exclude=exclude, rules=rules,
+                         incumbents=incumbents, leverage=leverage, max_ownership=max_ownership)
+        with self._lock:
+            self.solves[constraints] = (max_lineups, results)
+            self.solves.move_to_end(constraints)
+            while len(self.solves) > self.size:
+                self.solves.popitem(last=False)
+        return results
+
+    def _lookup(self, constraints, max_lineups, rules):
+        # returns (exact results or None, incumbents for a fresh search)
+        cpt_ids, lock_flex, exclude, rule_keys, leverage, max_ownership = constraints
+        stack_rules = _StackRules(self.table, rules) if rules else None
+        own = self.table.own
+        with self._lock:
+            solves = list(self.solves.items())
+        incumbents = []
+        for (old_cpt_ids, old_lock, old_exclude, old_rules, old_leverage, old_max_ownership), (size, results) \
+                in reversed(solves):
+            if not (cpt_ids <= old_cpt_ids and lock_flex >= old_lock and exclude >= old_exclude
+                    and rule_keys >= old_rules and leverage == old_leverage and max_ownership <= old_max_ownership):
+                continue
+            kept = [(score, (leads, flex)) for score, (leads, flex) in results
+                    if leads[0] in cpt_ids and lock_flex.issubset(flex) and exclude.isdisjoint(leads)
+                    and exclude.isdisjoint(flex) and (stack_rules is None or stack_rules.allows(leads, flex))
+                    and own[list(leads)].sum() + own[list(flex)].sum() <= max_ownership + OWN_TOLERANCE]
+            # a solve that returned fewer lineups than asked for listed every
+            # feasible lineup, so what survives is complete as well
+            if len(kept) >= max_lineups or len(results) < size:
+                return kept[:max_lineups], None
+            if len(kept) > len(incumbents):
+                incumbents = kept
+        return None, incumbents
+
+
+def _lineup(table, teams, leads, flex_ids):
+    roster = table.roster
+    lineup = [{"Name": table.names[i], "Role": slot.name, "Salary": float(table.slot_salary[s][i]),
+               "Proj": float(table.slot_proj[s][i]), "Own": float(table.own[i]), "Team": teams[i]}
+              for s, (slot, i) in enumerate(zip(roster.slots, leads))]
+    roles = roster.flex_roles(table.positions[table.pos_codes[list(flex_ids)]].tolist())
+    for i, role in zip(flex_ids, roles):
+        lineup.append({"Name": table.names[i], "Role": role, "Salary": float(table.salary[i]),
+                       "Proj": float(table.proj[i]), "Own": float(table.own[i]), "Team": teams[i]})
+    # players are listed in the order of the site's upload file
+    lineup.sort(key=lambda p: roster.header.index(p["Role"]))
+    total_salary = sum(p["Salary"] for p in lineup)
+    total_proj = sum(p["Proj"] for p in lineup)
+    total_own = sum(p["Own"] for p in lineup)
+    return {"players": lineup, "Salary": total_salary, "Projected": total_proj, "Ownership": total_own}
+
+
+def iter_lineups(df, lock_cpt=None, lock_flex=[], exclude=[], max_lineups=5, script=None,
+                 min_unique=0, max_exposure=1.0, rules=None, leverage=0.0, max_ownership=None, warm=None,
+                 roster=DK_SHOWDOWN, search=optimize):
+    # yields lineups as the optimizer settles on them: one by one in diverse mode,
+    # best first once the search finishes otherwise. leverage > 0 ranks lineups by
+    # projection less leverage points per percent of ownership; max_ownership caps
+    # the lineup's summed ownership. warm is the WarmStart built for this df and
+    # roster; non-diverse solves are answered from and recorded in it. search runs
+    # every optimizer search the request still needs. lock_cpt and script pick the first lead
+    # slot (CPT, MVP, or a classic roster's QB).
+    table = warm.table if warm is not None else PlayerTable.from_frame(df, roster)
+    exclude_ids = table.ids(exclude)
+    if len(table) - len(exclude_ids) < table.roster.size:
+        return
+    if lock_cpt:
+        cpt_ids = table.ids([lock_cpt])
+    elif script in SCRIPT_CPT_POSITIONS:
+        cpt_ids = table.ids_at(SCRIPT_CPT_POSITIONS[script])
+    else:
+        cpt_ids = range(len(table))
+    lock_ids = table.ids(lock_flex)
+    if len(lock_ids) < len(set(lock_flex)) or set(lock_ids) & set(exclude_ids):
+        return
+    if max_lineups > 1 and (min_unique or max_exposure < 1):
+        exempt = table.ids([lock_cpt]) if lock_cpt else []
+        solutions = iter_diverse(table, cpt_ids, lock_ids, max_lineups, min_unique, max_exposure, exempt=exempt,
+                                 rules=rules, exclude=exclude_ids, leverage=leverage, max_ownership=max_ownership,
+                                 search=search)
+    elif warm is not None:
+        solutions = warm.solve(cpt_ids, lock_ids, max_lineups, exclude_ids, rules, leverage, max_ownership, search)
+    else:
+        solutions = search(table, cpt_ids, lock_ids, max_lineups, exclude=exclude_ids, rules=rules,
+                           leverage=leverage, max_ownership=max_ownership)
+    teams = warm.teams if warm is not None else table.teams[table.team_codes].tolist()
+    for _, (leads, flex_ids) in solutions:
+        yield _lineup(table, teams, leads, flex_ids)
+
+
+def generate_all_lineups(df, lock_cpt=None, lock_flex=[], exclude=[], max_lineups=5, script=None,
+                         min_unique=0, max_exposure=1.0, rules=None, leverage=0.0, max_ownership=None, warm=None,
+                         roster=DK_SHOWDOWN, search=optimize):
+    lineups = iter_lineups(df, lock_cpt, lock_flex, exclude, max_lineups, script, min_unique, max_exposure, rules,
+                           leverage, max_ownership, warm, roster, search)
+    return sorted(lineups, key=lambda lu: lu["Projected"] - leverage * lu["Ownership"], reverse=True)
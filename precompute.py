@@ -0,0 +1,106 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from metrics import CACHE_REQUESTS
+from optimizer import DK_SHOWDOWN, PlayerTable, WarmStart, generate_all_lineups, optimize
+from slate import PLAYER_COLUMNS, matchup_players
+
+logger = logging.getLogger(__name__)
+
+SCRIPTS = ("", "run", "pass")
+
+
+def players_key(df):
+    hashed = pd.util.hash_pandas_object(df[PLAYER_COLUMNS], index=False)
+    return hashlib.sha1(hashed.values.tobytes()).hexdigest()
+
+
+class LineupCache:
+    # Top lineups for every (matchup, script) pair, keyed by a hash of the cleaned
+    # players so a changed sheet can never serve stale lineups. Recomputation
+    # runs on a single background thread whenever the slate changes, with its
+    # searches run by search; a miss on the request path goes through solve.
+    # Both default to solving inline.
+    def __init__(self, size, solve=generate_all_lineups, search=optimize, snapshots=None):
+        self.size = size
+        self.solve = solve
+        self.search = search
+        self.snapshots = snapshots
+        self.lineups = {}
+        self.warm = {}    # (players_key, roster name) -> WarmStart, showdown ones seeded with the precomputed solves
+        self._lock = threading.Lock()
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lineup-precompute")
+
+    def on_slate_change(self, players):
+        self._worker.submit(self._precompute, players)
+
+    def get(self, df, script, count):
+        script = script if script in SCRIPTS else ""
+        key = (players_key(df), script)
+        lineups = self.lineups.get(key)
+        CACHE_REQUESTS.inc(cache="lineups", result="miss" if lineups is None else "hit")
+        if lineups is None:
+            lineups = self.solve(df, max_lineups=self.size, script=script)
+            with self._lock:
+                self.lineups[key] = lineups
+        return lineups[:count]
+
+    def warm_start(self, df, roster=DK_SHOWDOWN):
+        key = (players_key(df), roster.name)
+        warm = self.warm.get(key)
+        if warm is None:
+            with self._lock:
+                warm = self.warm.setdefault(key, WarmStart(PlayerTable.from_frame(df, roster)))
+        return warm
+
+    def _precompute(self, players):
+        # every matchup on the slate is live before anything is solved, so one
+        # failed solve cannot get the others' lineups pruned
+        slate = [(matchup, matchup_players(players, matchup)) for matchup in players.index.unique()]
+        live = {players_key(df) for _, df in slate}
+        for matchup, df in slate:
+            key = players_key(df)
+            for script in SCRIPTS:
+                if (key, script) in self.lineups:
+                    continue
+                try:
+                    lineups = self._load(key, script)
+                    if lineups is None:
+                        lineups = generate_all_lineups(df, max_lineups=self.size, script=script,
+                                                       warm=self.warm_start(df), search=self.search)
+                        self._save(key, script, lineups)
+                except Exception:
+                    logger.exception("lineup precompute failed for %s (script %r)", matchup, script)
+                    continue
+                with self._lock:
+                    self.lineups[(key, script)] = lineups
+        with self._lock:
+            for key in [k for k in self.lineups if k[0] not in live]:
+                del self.lineups[key]
+            for key in [k for k in self.warm if k[0] not in live]:
+                del self.warm[key]
+        if self.snapshots is not None:
+            try:
+                self.snapshots.prune_lineups(live)
+            except Exception:
+                logger.exception("could not prune lineup snapshots")
+
+    def _load(self, key, script):
+        if self.snapshots is None:
+            return None
+        try:
+            return self.snapshots.load_lineups(key, script, self.size)
+        except Exception:
+            logger.exception("could not read lineup snapshot")
+            return None
+
+    def _save(self, key, script, lineups):
+        if self.snapshots is not None:
+            try:
+                self.snapshots.save_lineups(key, script, self.size, lineups)
+            except Exception:
+                logger.exception("could not save lineup snapshot")
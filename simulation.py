@@ -0,0 +1,112 @@
+import numpy as np
+
+from optimizer import DK_SHOWDOWN, DST_POSITIONS, PlayerTable
+
+SIMULATIONS = 10000
+SIM_CHUNK = 2000    # simulated games drawn per batch
+CASH_FRACTION = 0.2
+PERCENTILES = (10, 50, 90)
+
+# Spread of a player's outcome as a fraction of the projection
+POSITION_CV = {"QB": 0.35, "RB": 0.5, "WR": 0.6, "TE": 0.65, "K": 0.5, "DST": 0.8}
+DEFAULT_CV = 0.6
+# Same-team correlation between a QB and the pass catchers / backs
+TEAMMATE_CORRELATION = {("QB", "WR"): 0.4, ("QB", "TE"): 0.3, ("QB", "RB"): 0.1}
+# A defense against the opposing offense; opponents are the other team of the matchup
+OPPOSING_DST_CORRELATION = {"QB": -0.35, "RB": -0.2, "WR": -0.2, "TE": -0.2, "K": -0.15}
+
+
+def _position(pos):
+    return "DST" if pos in DST_POSITIONS else pos
+
+
+def player_correlation(table):
+    positions = np.array([_position(p) for p in table.positions[table.pos_codes]])
+    same_team = table.team_codes[:, None] == table.team_codes[None, :]
+    corr = np.zeros((len(table), len(table)))
+    for (a, b), rho in TEAMMATE_CORRELATION.items():
+        pair = same_team & (positions == a)[:, None] & (positions == b)[None, :]
+        corr[pair | pair.T] = rho
+    for pos, rho in OPPOSING_DST_CORRELATION.items():
+        pair = ~same_team & (positions == "DST")[:, None] & (positions == pos)[None, :]
+        corr[pair | pair.T] = rho
+    np.fill_diagonal(corr, 1.0)
+    # pairwise rules can describe an impossible matrix; clip it back to the
+    # nearest positive definite one before factoring
+    values, vectors = np.linalg.eigh(corr)
+    corr = (vectors * np.clip(values, 1e-6, None)) @ vectors.T
+    scale = np.sqrt(np.diag(corr))
+    return corr / np.outer(scale, scale)
+
+
+def simulate_players(table, n_sims=SIMULATIONS, seed=None):
+    # yields (chunk, n_players) arrays of correlated fantasy point outcomes
+    rng = np.random.default_rng(seed)
+    chol = np.linalg.cholesky(player_correlation(table))
+    cv = np.array([POSITION_CV.get(_position(p), DEFAULT_CV) for p in table.positions[table.pos_codes]])
+    sd = np.abs(table.proj) * cv
+    for start in range(0, n_sims, SIM_CHUNK):
+        size = min(SIM_CHUNK, n_sims - start)
+        z = rng.standard_normal((size, len(table))) @ chol.T
+        yield np.maximum(table.proj + z * sd, 0.0)
+
+
+def lineup_weights(table, lead_ids, flex_ids):
+    # (n_players, n_lineups) matrix so that outcomes @ weights scores every lineup
+    # at once; lead_ids is (n_lineups, lead slots) in the table's roster order
+    lead_ids = np.asarray(lead_ids).reshape(len(lead_ids), -1)
+    weights = np.zeros((len(table), len(lead_ids)))
+    cols = np.arange(len(lead_ids))
+    for s, slot in enumerate(table.roster.slots):
+        weights[lead_ids[:, s], cols] += slot.points
+    flex_ids = np.asarray(flex_ids).reshape(len(lead_ids), -1)
+    for slot in range(flex_ids.shape[1]):
+        weights[flex_ids[:, slot], cols] += 1.0
+    return weights
+
+
+def simulate_lineups(table, lead_ids, flex_ids, n_sims=SIMULATIONS, seed=None, cash_fraction=CASH_FRACTION):
+    # Win and cash are measured within the lineup set: a lineup wins a simulated
+    # game when it outscores every other lineup and cashes when it finishes in the
+    # top cash_fraction of them.
+    weights = lineup_weights(table, lead_ids, flex_ids)
+    n_lineups = weights.shape[1]
+    cash_rank = max(0, n_lineups - int(np.ceil(n_lineups * cash_fraction)))
+    scores = np.empty((n_sims, n_lineups))
+    wins = np.zeros(n_lineups)
+    cashes = np.zeros(n_lineups)
+    row = 0
+    for outcomes in simulate_players(table, n_sims, seed):
+        chunk = outcomes @ weights
+        scores[row:row + len(chunk)] = chunk
+        row += len(chunk)
+        best = chunk.max(axis=1, keepdims=True)
+        winners = chunk == best
+        wins += (winners / winners.sum(axis=1, keepdims=True)).sum(axis=0)
+        cash_line = np.partition(chunk, cash_rank, axis=1)[:, cash_rank:cash_rank + 1]
+        cashes += (chunk >= cash_line).sum(axis=0)
+    percentiles = np.percentile(scores, PERCENTILES, axis=0)
+    stats = {"mean": scores.mean(axis=0), "std": scores.std(axis=0),
+             "win": wins / n_sims, "cash": cashes / n_sims}
+    for p, values in zip(PERCENTILES, percentiles):
+        stats[f"p{p}"] = values
+    return stats
+
+
+def split_lineup(table, lineup):
+    # (lead ids in slot order, flex ids) of a generate_all_lineups dict
+    roles = {p["Role"]: table.index[p["Name"]] for p in lineup["players"]}
+    slots = {slot.name for slot in table.roster.slots}
+    return ([roles[slot.name] for slot in table.roster.slots],
+            [table.index[p["Name"]] for p in lineup["players"] if p["Role"] not in slots])
+
+
+def add_simulation(df, lineups, n_sims=SIMULATIONS, seed=None, roster=DK_SHOWDOWN):
+    # returns copies of the generate_all_lineups dicts with a "Sim" summary each
+    if not lineups:
+        return lineups
+    table = PlayerTable.from_frame(df, roster)
+    lead_ids, flex_ids = zip(*(split_lineup(table, lu) for lu in lineups))
+    stats = simulate_lineups(table, lead_ids, flex_ids, n_sims, seed)
+    return [dict(lu, Sim={key: float(values[i]) for key, values in stats.items()})
+            for i, lu in enumerate(lineups)]
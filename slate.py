@@ -0,0 +1,293 @@
+import csv
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from io import StringIO
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import CACHE_REQUESTS, SHEET_FETCH_FAILURES, SHEET_FETCHES, span
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_SHEET_CSV_URLS = [
+    "https://docs.google.com/spreadsheets/d/e/2PACX-1vSwiZjQ1dK9Wxe_GYcoeELm3-nXy-xGEG4WSbCXuk-JClxcF9kEseWhAovCsWwx_8NkgoSryDNKZATO/pub?output=csv",
+    "https://docs.google.com/spreadsheets/d/e/2PACX-1vSwiZjQ1dK9Wxe_GYcoeELm3-nXy-xGEG4WSbCXuk-JClxcF9kEseWhAovCsWwx_8NkgoSryDNKZATO/pub?gid=1631685663&single=true&output=csv"
+]
+
+PLAYER_COLUMNS = ["Name", "Team", "POS", "Salary", "Proj", "Matchup", "Own"]
+SLATE_TTL = float(os.environ.get("SLATE_TTL", 60))
+FETCH_TIMEOUT = 10
+FETCH_WORKERS = 8
+
+FetchResult = namedtuple("FetchResult", ["url", "status", "text", "etag", "last_modified", "error", "elapsed"])
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS))
+_session.mount("http://", HTTPAdapter(pool_connections=FETCH_WORKERS, pool_maxsize=FETCH_WORKERS))
+_fetch_pool = ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="sheet-fetch")
+
+
+def _fetch(url, headers):
+    start = time.perf_counter()
+    try:
+        r = _session.get(url, headers=headers, timeout=FETCH_TIMEOUT)
+        if r.status_code != 304:
+            r.raise_for_status()
+        text = r.text if r.status_code != 304 else None
+        return FetchResult(url, r.status_code, text, r.headers.get("ETag"), r.headers.get("Last-Modified"),
+                           None, time.perf_counter() - start)
+    except requests.RequestException as e:
+        status = e.response.status_code if e.response is not None else None
+        return FetchResult(url, status, None, None, None, f"{type(e).__name__}: {e}", time.perf_counter() - start)
+
+
+def fetch_sheets(sheet_requests):
+    # sheet_requests is a list of (url, conditional headers); every sheet is
+    # downloaded concurrently over the shared keep-alive session and results
+    # come back in the same order
+    futures = [_fetch_pool.submit(_fetch, url, headers) for url, headers in sheet_requests]
+    return [f.result() for f in futures]
+
+
+# Canonical column -> test on the stripped, upper-cased sheet header; the first match wins
+SCHEMA_RULES = [
+    ("Name", lambda c: "PLAYER" in c),
+    ("Salary", lambda c: "SALARY" in c),
+    # Use the first "FINAL POINTS" column, not "FINAL POINTS1"
+    ("Proj", lambda c: c == "FINAL POINTS"),
+    ("Team", lambda c: "TEAM" in c),
+    ("POS", lambda c: c == "POS"),
+    ("Matchup", lambda c: c.replace(' ', '') == "MATCHUP"),
+]
+# Columns a sheet may leave out; the cleaned frame fills them with a default
+OPTIONAL_SCHEMA_RULES = [
+    # projected ownership: OWN, OWN%, OWNERSHIP, PROJ OWN, POWN, ...
+    ("Own", lambda c: c.replace("%", "").replace(" ", "") in ("OWN", "POWN", "PROJOWN")
+     or c.replace(" ", "").endswith("OWNERSHIP")),
+]
+TEXT_COLUMNS = ["Name", "Team", "POS", "Salary", "Matchup", "Own"]
+
+
+@lru_cache(maxsize=32)
+def detect_schema(header):
+    # header is the tuple of raw column names; returns canonical name -> column
+    # position, detected once per distinct sheet layout
+    normalized = [str(c).strip().upper() for c in header]
+    schema = {}
+    for name, rule in SCHEMA_RULES:
+        position = next((i for i, c in enumerate(normalized) if rule(c)), None)
+        if position is None:
+            raise ValueError(f"sheet has no {name} column")
+        schema[name] = position
+    for name, rule in OPTIONAL_SCHEMA_RULES:
+        position = next((i for i, c in enumerate(normalized) if rule(c)), None)
+        if position is not None:
+            schema[name] = position
+    return schema
+
+
+def _clean_columns(df):
+    df = df.dropna(how='all').copy()
+    df["Salary"] = pd.to_numeric(df["Salary"].astype(str).str.replace(r'[\$,]', '', regex=True), errors="coerce").astype(float)
+    df["Proj"] = pd.to_numeric(df["Proj"], errors="coerce").astype(float)
+    if "Own" in df:
+        raw = df["Own"].astype(str)
+        own = pd.to_numeric(raw.str.replace('%', '', regex=False), errors="coerce")
+        # sheets give either percents (12.5, "12.5%") or fractions (0.125)
+        if not raw.str.contains('%', regex=False).any() and own.max() <= 1:
+            own = own * 100
+        df["Own"] = own.fillna(0.0).astype(float)
+    else:
+        df["Own"] = 0.0
+    df = df.dropna(subset=["Name", "Salary", "Proj", "POS", "Matchup"]).drop_duplicates(subset=["Name", "Matchup"])
+    return df[PLAYER_COLUMNS]
+
+
+def clean_data(df):
+    schema = detect_schema(tuple(df.columns))
+    df = df.iloc[:, list(schema.values())].copy()
+    df.columns = list(schema)
+    return _clean_columns(df)
+
+
+def parse_sheet(text):
+    # reads only the detected columns, with the text columns kept as strings so
+    # the parser skips type inference for them
+    header = tuple(next(csv.reader(StringIO(text)), []))
+    schema = detect_schema(header)
+    positions = sorted(schema.items(), key=lambda item: item[1])
+    df = pd.read_csv(StringIO(text), usecols=[i for _, i in positions],
+                     dtype={schema[name]: str for name in TEXT_COLUMNS if name in schema})
+    df.columns = [name for name, _ in positions]
+    return _clean_columns(df)
+
+
+def matchup_players(players, matchup):
+    if matchup not in players.index:
+        return pd.DataFrame([], columns=PLAYER_COLUMNS)
+    return players.loc[[matchup]].reset_index(drop=True)
+
+
+class _Source:
+    def __init__(self, url):
+        self.url = url
+        self.etag = None
+        self.last_modified = None
+        self.digest = None
+        self.frame = None
+
+
+class SlateStore:
+    # Process-wide cache of the cleaned sheets. Reads never wait on the network
+    # once a slate is loaded: past the TTL the stale slate keeps being served
+    # while one background thread revalidates the sheets with ETag /
+    # Last-Modified, so unchanged sheets cost a 304 and no parsing. With a
+    # snapshot store the first read serves the last saved slate and revalidates
+    # it in the background, and a sheet that cannot be fetched keeps its saved copy.
+    def __init__(self, urls, ttl=SLATE_TTL, fetch=fetch_sheets, snapshots=None):
+        self.sources = [_Source(url) for url in urls]
+        self.ttl = ttl
+        self.fetch = fetch
+        self.snapshots = snapshots
+        self.players = None
+        self.version = 0
+        self.digest = None    # hash of the published sheets' contents, the same in every process
+        self.loaded_at = 0.0
+        self.failures = []
+        self.listeners = []
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def get(self):
+        if self.players is None:
+            CACHE_REQUESTS.inc(cache="slate", result="miss")
+            with self._lock:
+                if self.players is None and not self._restore():
+                    self._refresh()
+            if self.loaded_at == 0.0:
+                self._refresh_in_background()
+        elif time.monotonic() - self.loaded_at > self.ttl:
+            CACHE_REQUESTS.inc(cache="slate", result="stale")
+            self._refresh_in_background()
+        else:
+            CACHE_REQUESTS.inc(cache="slate", result="hit")
+        return self.players
+
+    def matchups(self):
+        return sorted(self.get().index.unique())
+
+    def players_for(self, matchup):
+        return matchup_players(self.get(), matchup)
+
+    def subscribe(self, listener):
+        # listener(players) is called with the new cleaned slate whenever it changes
+        self.listeners.append(listener)
+
+    def refresh(self):
+        with self._lock:
+            self._refresh()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            self._refreshing = False
+
+    def _restore(self):
+        # loads the latest snapshot, if any, leaving it due for revalidation
+        if self.snapshots is None:
+            return False
+        try:
+            snapshot = self.snapshots.latest_slate()
+        except Exception:
+            logger.exception("could not read slate snapshot")
+            return False
+        if snapshot is None:
+            return False
+        version, saved = snapshot
+        for source in self.sources:
+            if source.url in saved:
+                source.digest, source.etag, source.last_modified, source.frame = saved[source.url]
+        self._publish(version)
+        self.loaded_at = 0.0
+        return True
+
+    def _publish(self, version):
+        frames = [s.frame for s in self.sources if s.frame is not None]
+        players = pd.concat(frames) if frames else pd.DataFrame([], columns=PLAYER_COLUMNS)
+        players.index = players["Matchup"].astype(str).str.strip().values
+        players = players[players.index != ""].sort_index(kind="stable")
+        self.players = players
+        self.version = version
+        self.digest = hashlib.sha1(":".join(s.digest or "" for s in self.sources).encode()).hexdigest()
+        for listener in self.listeners:
+            listener(players)
+
+    def _refresh(self):
+        with span("sheet_fetch"):
+            results = self.fetch([(source.url, self._conditional_headers(source)) for source in self.sources])
+        changed = False
+        failures = []
+        for source, result in zip(self.sources, results):
+            if result.error is None and result.status != 304:
+                try:
+                    # sheets served without validators still skip parsing when
+                    # the body is byte-for-byte what was parsed last time
+                    digest = hashlib.sha1(result.text.encode()).hexdigest()
+                    if digest != source.digest:
+                        with span("parse_sheet"):
+                            source.frame = parse_sheet(result.text)
+                        source.digest = digest
+                        changed = True
+                        SHEET_FETCHES.inc(result="changed")
+                    else:
+                        SHEET_FETCHES.inc(result="unchanged")
+                    source.etag = result.etag
+                    source.last_modified = result.last_modified
+                except Exception as e:
+                    result = result._replace(error=f"{type(e).__name__}: {e}")
+            if result.status == 304:
+                SHEET_FETCHES.inc(result="not_modified")
+            if result.error is not None:
+                SHEET_FETCHES.inc(result="failed")
+                SHEET_FETCH_FAILURES.inc(url=result.url)
+                failures.append(result)
+                logger.warning("sheet fetch failed for %s (status %s, %.2fs): %s",
+                               result.url, result.status, result.elapsed, result.error)
+        self.failures = failures
+        if changed or self.players is None:
+            self._publish(self._save() if changed else self.version + 1)
+        self.loaded_at = time.monotonic()
+
+    def _save(self):
+        if self.snapshots is not None:
+            try:
+                return max(self.snapshots.save_slate(self.sources), self.version + 1)
+            except Exception:
+                logger.exception("could not save slate snapshot")
+        return self.version + 1
+
+    @staticmethod
+    def _conditional_headers(source):
+        headers = {}
+        if source.frame is not None:
+            if source.etag:
+                headers["If-None-Match"] = source.etag
+            if source.last_modified:
+                headers["If-Modified-Since"] = source.last_modified
+        return headers
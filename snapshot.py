@@ -0,0 +1,124 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+import pandas as pd
+
+from slate import PLAYER_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Snapshots are off unless SNAPSHOT_PATH names a file on a persistent volume;
+# a dyno's own disk does not survive a restart, so there is no local default
+SNAPSHOT_PATH = os.environ.get("SNAPSHOT_PATH", "")
+SNAPSHOT_KEEP = 5    # slate versions kept
+MMAP_SIZE = 64 * 1024 * 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS slates (
+    version INTEGER PRIMARY KEY,
+    saved_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sources (
+    version INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    digest TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    PRIMARY KEY (version, url)
+);
+CREATE TABLE IF NOT EXISTS players (
+    version INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    Name TEXT, Team TEXT, POS TEXT, Salary REAL, Proj REAL, Matchup TEXT, Own REAL
+);
+CREATE INDEX IF NOT EXISTS players_version ON players (version, url);
+CREATE TABLE IF NOT EXISTS lineups (
+    players_key TEXT NOT NULL,
+    script TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    saved_at REAL NOT NULL,
+    lineups TEXT NOT NULL,
+    PRIMARY KEY (players_key, script)
+);
+"""
+
+
+class SnapshotStore:
+    # Versioned copies of the cleaned sheets and the precomputed lineups in one
+    # SQLite file, so a restarted process can serve the last good slate right
+    # away and keep serving it while the sheets are unreachable.
+    def __init__(self, path, keep=SNAPSHOT_KEEP):
+        self.path = path
+        self.keep = keep
+        self._lock = threading.Lock()
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+            # files written before a column was added get it with no value
+            known = {row[1] for row in conn.execute("PRAGMA table_info(players)")}
+            for column in PLAYER_COLUMNS:
+                if column not in known:
+                    conn.execute(f"ALTER TABLE players ADD COLUMN {column}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        return conn
+
+    def save_slate(self, sources):
+        # sources are the SlateStore's _Source objects; returns the new version
+        with self._lock, closing(self._connect()) as conn, conn:
+            version = conn.execute("INSERT INTO slates (saved_at) VALUES (?)", (time.time(),)).lastrowid
+            for source in sources:
+                if source.frame is None:
+                    continue
+                conn.execute("INSERT INTO sources VALUES (?, ?, ?, ?, ?)",
+                             (version, source.url, source.digest, source.etag, source.last_modified))
+                rows = source.frame[PLAYER_COLUMNS].itertuples(index=False, name=None)
+                conn.executemany(f"INSERT INTO players (version, url, {', '.join(PLAYER_COLUMNS)}) "
+                                 f"VALUES ({', '.join('?' * (len(PLAYER_COLUMNS) + 2))})",
+                                 [(version, source.url, *row) for row in rows])
+            stale = (version - self.keep,)
+            for table in ("slates", "sources", "players"):
+                conn.execute(f"DELETE FROM {table} WHERE version <= ?", stale)
+        return version
+
+    def latest_slate(self):
+        # returns (version, {url: (digest, etag, last_modified, frame)}) or None
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT MAX(version) FROM slates").fetchone()
+            if row[0] is None:
+                return None
+            version = row[0]
+            sources = conn.execute("SELECT url, digest, etag, last_modified FROM sources WHERE version = ?",
+                                   (version,)).fetchall()
+            players = pd.read_sql_query(f"SELECT url, {', '.join(PLAYER_COLUMNS)} FROM players WHERE version = ?",
+                                        conn, params=(version,))
+        players["Own"] = players["Own"].fillna(0.0).astype(float)
+        frames = {url: frame[PLAYER_COLUMNS].reset_index(drop=True) for url, frame in players.groupby("url")}
+        return version, {url: (digest, etag, last_modified, frames.get(url, pd.DataFrame([], columns=PLAYER_COLUMNS)))
+                         for url, digest, etag, last_modified in sources}
+
+    def save_lineups(self, players_key, script, size, lineups):
+        # size is the number of lineups asked for; fewer means that was all of them
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO lineups VALUES (?, ?, ?, ?, ?)",
+                         (players_key, script, size, time.time(), json.dumps(lineups)))
+
+    def load_lineups(self, players_key, script, size):
+        # returns the saved lineups if they were generated for at least size
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT lineups FROM lineups WHERE players_key = ? AND script = ? AND size >= ?",
+                               (players_key, script, size)).fetchone()
+        return json.loads(row[0])[:size] if row else None
+
+    def prune_lineups(self, live_keys):
+        live_keys = list(live_keys)
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(f"DELETE FROM lineups WHERE players_key NOT IN ({', '.join('?' * len(live_keys))})",
+                         live_keys)
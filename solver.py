@@ -0,0 +1,164 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from metrics import SOLVER_REJECTED, span
+
+SOLVER_PROCESSES = int(os.environ.get("SOLVER_PROCESSES", 0)) or os.cpu_count() or 1
+SOLVER_QUEUE = int(os.environ.get("SOLVER_QUEUE", 8))    # requests allowed to wait for a busy solver
+RETRY_AFTER = int(os.environ.get("SOLVER_RETRY_AFTER", 5))
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after=RETRY_AFTER):
+        super().__init__("lineup solver is busy, try again shortly")
+        self.retry_after = retry_after
+
+
+def _counted(fn, args, kwargs):
+    # runs in the worker process, whose counters never reach /metrics; what the
+    # call added to them travels back with its result
+    before = metrics.counter_values()
+    result = fn(*args, **kwargs)
+    return result, metrics.counts_since(before)
+
+
+def _result(future):
+    result, counts = future.result()
+    metrics.add_counts(counts)
+    return result
+
+
+class Held:
+    # Iterates items while holding one admitted solver slot. The slot goes back
+    # once, when items runs out or close() is called, whichever comes first. A
+    # server never iterates the body of a HEAD response, or of one whose client
+    # left before the first chunk, but it still closes the response, so routes
+    # hand close() to response.call_on_close.
+    def __init__(self, items, release):
+        self._items = items
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            yield from self._items
+        finally:
+            self.close()
+
+    def close(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        try:
+            close = getattr(self._items, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self._release()
+
+
+class SolverPool:
+    # Keeps CPU-bound optimization off the web threads. Work runs in a small
+    # process pool; at most processes + queue_size requests are admitted at once
+    # and anything beyond that is turned away with Overloaded straight away, so a
+    # burst of users queues briefly instead of tying up every web thread.
+    def __init__(self, processes=SOLVER_PROCESSES, queue_size=SOLVER_QUEUE):
+        self.processes = processes
+        self._slots = threading.BoundedSemaphore(processes + queue_size)
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def run(self, fn, *args, **kwargs):
+        # fn must be a module-level function so the worker process can import it
+        self._admit()
+        try:
+            return self._call(fn, *args, **kwargs)
+        finally:
+            self._slots.release()
+
+    def queue(self, fn, *args, **kwargs):
+        # run() for background work: it waits for a slot instead of being turned
+        # away, since there is no client to answer 503 to
+        self._slots.acquire()
+        try:
+            return self._call(fn, *args, **kwargs)
+        finally:
+            self._slots.release()
+
+    def run_all(self, fn, calls):
+        # Runs fn(*args, **kwargs) for every (key, args, kwargs) in calls and
+        # yields (key, result) as each one finishes. The batch holds one slot and
+        # shares the pool's processes with every other solve rather than starting
+        # its own. Admission happens here, before the first result is asked for,
+        # so the caller can still answer 503; closing the results early cancels
+        # whatever has not started.
+        self._admit()
+
+        def results():
+            pool, futures = None, {}
+            try:
+                pool = self._executor()
+                futures = {pool.submit(_counted, fn, args, kwargs): key for key, args, kwargs in calls}
+                for future in as_completed(futures):
+                    yield futures[future], _result(future)
+            except BrokenProcessPool:
+                self._discard(pool)
+                raise
+            finally:
+                for future in futures:
+                    future.cancel()
+
+        return Held(results(), self._slots.release)
+
+    def stream(self, start):
+        # Admits a job whose results are streamed as they are produced. start(call)
+        # returns the job's iterator; it hands each expensive step to
+        # call(fn, *args, **kwargs), which runs it in the pool under the job's
+        # slot, so only the cheap glue between steps stays on the web thread. The
+        # slot is held until the iterator is exhausted or closed. Admission
+        # happens here rather than on first iteration so the caller can still
+        # answer 503.
+        self._admit()
+        try:
+            items = start(self._call)
+        except BaseException:
+            self._slots.release()
+            raise
+        return Held(items, self._slots.release)
+
+    def _call(self, fn, *args, **kwargs):
+        # runs fn in the pool for a caller that already holds a slot
+        pool = None
+        try:
+            pool = self._executor()
+            with span("solver"):
+                return _result(pool.submit(_counted, fn, args, kwargs))
+        except BrokenProcessPool:
+            self._discard(pool)
+            raise
+
+    def _admit(self):
+        if not self._slots.acquire(blocking=False):
+            SOLVER_REJECTED.inc()
+            raise Overloaded()
+
+    def _discard(self, pool):
+        # a worker died (e.g. killed for memory); start a fresh pool next time
+        with self._lock:
+            if pool is not None and self._pool is pool:
+                self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            # started on first use so gunicorn workers each get their own pool
+            # after forking; forkserver keeps the web threads out of the children
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processes,
+                                                 mp_context=multiprocessing.get_context("forkserver"))
+            return self._pool